@@ -0,0 +1,122 @@
+"""Download path benchmark.
+
+Serves a synthetic encrypted HLS episode with the local server of
+toutv.tests.hls_server and downloads it with Downloader,
+ToutvApiSegmentProvider and FilesystemSegmentHandler, once per number of
+segment workers. Each download runs in its own child process so that
+its CPU time and peak RSS do not include the server's.
+
+Run from the root of the repository:
+
+    $ python3 -m benchmarks.bench_download [--segments N]
+                                           [--segment-size BYTES]
+                                           [--workers N [N ...]]
+                                           [--latency SECONDS]
+                                           [--bandwidth BYTES_PER_SEC]
+                                           [--truncate-rate RATE]
+                                           [--directory DIR]
+
+--latency and --bandwidth apply to each response, so they simulate a
+distant server rather than a slow client link.
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from toutv import dl
+from toutv.tests import hls_server
+
+
+def _peak_rss_kib():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in bytes on OS X, and in kiB on Linux
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+
+    return maxrss
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    return usage.ru_utime + usage.ru_stime
+
+
+def _run_child(master_url, bitrate, num_workers, output_dir):
+    episode = hls_server.make_episode(master_url)
+    seg_provider = dl.ToutvApiSegmentProvider(episode, bitrate)
+    seg_handler = dl.FilesystemSegmentHandler(episode, bitrate, output_dir,
+                                              overwrite=True)
+    downloader = dl.Downloader(seg_provider, seg_handler,
+                               num_workers=num_workers)
+
+    begin_cpu = _cpu_time()
+    begin = time.perf_counter()
+    downloader.download()
+    elapsed = time.perf_counter() - begin
+    cpu = _cpu_time() - begin_cpu
+    size = os.stat(seg_handler.output_path).st_size
+    os.remove(seg_handler.output_path)
+
+    print('{} {} {} {}'.format(elapsed, cpu, _peak_rss_kib(), size))
+
+
+def _run(args):
+    server = hls_server.HlsServer(num_segments=args.segments,
+                                  segment_size=args.segment_size,
+                                  bitrates=[1000000],
+                                  latency=args.latency,
+                                  bandwidth=args.bandwidth,
+                                  truncate_rate=args.truncate_rate)
+    total_mib = server.num_segments * server.segment_size / (1 << 20)
+    print('Downloading {} segments of {} bytes ({:.1f} MiB)\n'.format(server.num_segments, server.segment_size, total_mib))
+    print('{:<10}{:>12}{:>12}{:>12}{:>12}{:>18}'.format('workers', 'time (s)', 'MB/s', 'segs/s', 'CPU (s)', 'peak RSS (MiB)'))
+
+    with server, tempfile.TemporaryDirectory(dir=args.directory) as output_dir:
+        for num_workers in args.workers:
+            cmd = [
+                sys.executable, '-m', 'benchmarks.bench_download', '--child',
+                server.master_url, '--workers', str(num_workers),
+                '--directory', output_dir,
+            ]
+            output = subprocess.check_output(cmd, universal_newlines=True)
+            elapsed, cpu, peak_rss, size = output.split()
+            elapsed = float(elapsed)
+            mb_s = int(size) / 1e6 / elapsed
+            segs_s = server.num_segments / elapsed
+            peak_rss = int(peak_rss) / 1024
+            print('{:<10}{:>12.3f}{:>12.1f}{:>12.1f}{:>12.2f}{:>18.1f}'.format(num_workers, elapsed, mb_s, segs_s, float(cpu), peak_rss))
+
+
+def _main():
+    p = argparse.ArgumentParser(description='Download path benchmark')
+    p.add_argument('--segments', type=int, default=200,
+                   help='Number of segments (default: 200)')
+    p.add_argument('--segment-size', type=int, default=512 * 1024,
+                   help='Size of each segment in bytes (default: 524288)')
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8],
+                   help='Numbers of segment workers to try (default: 1 4 8)')
+    p.add_argument('--latency', type=float, default=0,
+                   help='Latency of each response in seconds (default: 0)')
+    p.add_argument('--bandwidth', type=int,
+                   help='Bandwidth of each response in bytes per second (default: unlimited)')
+    p.add_argument('--truncate-rate', type=float, default=0,
+                   help='Probability that a segment response is cut (default: 0)')
+    p.add_argument('--directory', default=os.getcwd(),
+                   help='Directory in which to create the files (default: CWD)')
+    p.add_argument('--child', help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child:
+        _run_child(args.child, 1000000, args.workers[0], args.directory)
+    else:
+        _run(args)
+
+
+if __name__ == '__main__':
+    _main()
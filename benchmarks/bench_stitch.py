@@ -0,0 +1,133 @@
+"""Segment files stitching benchmark.
+
+Creates a few thousand synthetic segment files, stitches them with
+FilesystemSegmentHandler and reports the elapsed time and the peak RSS of
+the process. Each method runs in its own child process so that the peak
+RSS of one method does not hide the one of another.
+
+Run from the root of the repository:
+
+    $ python3 -m benchmarks.bench_stitch [--segments N] [--segment-size BYTES]
+                                         [--directory DIR]
+
+Methods:
+
+  * kernel: kernel-side copies (copy_file_range(2)/sendfile(2)), as
+    used by the handler
+  * chunked: the fallback copying by chunks of 1 MiB
+  * read-all: reads each segment file completely in memory before writing
+    it (the former implementation)
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from toutv import bos
+from toutv import dl
+
+
+_METHODS = ['kernel', 'chunked', 'read-all']
+
+
+def _peak_rss_kib():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in bytes on OS X, and in kiB on Linux
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+
+    return maxrss
+
+
+def _make_handler(output_dir):
+    emission = bos.Emission()
+    emission.Id = 1
+    emission.Title = 'Benchmark'
+
+    episode = bos.Episode()
+    episode.Id = 1
+    episode.Title = 'Stitch'
+    episode.set_emission(emission)
+
+    return dl.FilesystemSegmentHandler(episode, 1000000, output_dir,
+                                       overwrite=True)
+
+
+def _create_segment_files(handler, num_segments, segment_size):
+    data = os.urandom(segment_size)
+
+    for segindex in range(num_segments):
+        handler.on_segment(segindex, data)
+
+
+def _read_all_append_file(src, dst, **kwargs):
+    dst.write(src.read())
+
+
+def _run_child(method, num_segments, output_dir):
+    handler = _make_handler(output_dir)
+
+    if method == 'chunked':
+        append_file = dl._append_file
+        dl._append_file = lambda src, dst: append_file(src, dst, kernel_copy=False)
+    elif method == 'read-all':
+        dl._append_file = _read_all_append_file
+
+    begin = time.perf_counter()
+    handler._stitch_segment_files(num_segments)
+    elapsed = time.perf_counter() - begin
+    size = os.stat(handler.output_path).st_size
+    os.remove(handler.output_path)
+
+    print('{} {} {}'.format(elapsed, _peak_rss_kib(), size))
+
+
+def _run(num_segments, segment_size, directory):
+    total_mib = num_segments * segment_size / (1 << 20)
+    print('Stitching {} segments of {} bytes ({:.1f} MiB)\n'.format(num_segments, segment_size, total_mib))
+    print('{:<10}{:>12}{:>12}{:>18}'.format('method', 'time (s)', 'MiB/s', 'peak RSS (MiB)'))
+
+    with tempfile.TemporaryDirectory(dir=directory) as output_dir:
+        # The segment files are created once, by this process, so that
+        # the children only measure the stitching.
+        handler = _make_handler(output_dir)
+        handler.initialize()
+        _create_segment_files(handler, num_segments, segment_size)
+
+        for method in _METHODS:
+            cmd = [
+                sys.executable, '-m', 'benchmarks.bench_stitch', '--child',
+                method, '--segments', str(num_segments), '--directory',
+                output_dir,
+            ]
+            output = subprocess.check_output(cmd, universal_newlines=True)
+            elapsed, peak_rss, size = output.split()
+            elapsed = float(elapsed)
+            peak_rss = int(peak_rss) / 1024
+            mib_s = int(size) / (1 << 20) / elapsed
+            print('{:<10}{:>12.3f}{:>12.1f}{:>18.1f}'.format(method, elapsed, mib_s, peak_rss))
+
+
+def _main():
+    p = argparse.ArgumentParser(description='Segment files stitching benchmark')
+    p.add_argument('--segments', type=int, default=3000,
+                   help='Number of segments (default: 3000)')
+    p.add_argument('--segment-size', type=int, default=256 * 1024,
+                   help='Size of each segment in bytes (default: 262144)')
+    p.add_argument('--directory', default=os.getcwd(),
+                   help='Directory in which to create the files (default: CWD)')
+    p.add_argument('--child', choices=_METHODS, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child:
+        _run_child(args.child, args.segments, args.directory)
+    else:
+        _run(args.segments, args.segment_size, args.directory)
+
+
+if __name__ == '__main__':
+    _main()
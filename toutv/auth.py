@@ -28,9 +28,9 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import re
-import requests
 import toutv.config
 import toutv.exceptions
+import toutv.net
 
 class Auth:
 
@@ -45,7 +45,7 @@ class Auth:
                 "Host"              : "services.radio-canada.ca",
                 }
 
-        r = requests.get(toutv.config.TOUTV_AUTH_CLAIMS_URL.format(token), headers=headers)
+        r = toutv.net.get_session().get(toutv.config.TOUTV_AUTH_CLAIMS_URL.format(token), headers=headers)
 
         if r.status_code != 200:
             raise toutv.exceptions.UnexpectedHttpStatusCodeError(toutv.config.TOUTV_AUTH_CLAIMS_URL.format(token), r.status_code)
@@ -79,7 +79,7 @@ class Auth:
                 "Content-type"      : "application/x-www-form-urlencoded",
                 }
 
-        r = requests.post(toutv.config.TOUTV_AUTH_TOKEN_URL, headers=headers, data=payload, allow_redirects=False)
+        r = toutv.net.get_session().post(toutv.config.TOUTV_AUTH_TOKEN_URL, headers=headers, data=payload, allow_redirects=False)
 
         if r.status_code != 302:
             raise toutv.exceptions.UnexpectedHttpStatusCodeError(toutv.config.TOUTV_AUTH_TOKEN_URL, r.status_code)
@@ -94,7 +94,7 @@ class Auth:
                 "X-Requested-With"  : "tv.tou.android"
                 }
 
-        r = requests.get(toutv.config.TOUTV_AUTH_SESSION_URL, headers=headers)
+        r = toutv.net.get_session().get(toutv.config.TOUTV_AUTH_SESSION_URL, headers=headers)
 
         if r.status_code != 200:
             raise toutv.exceptions.UnexpectedHttpStatusCodeError(toutv.config.TOUTV_AUTH_SESSION_URL, r.status_code)
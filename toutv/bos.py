@@ -34,6 +34,7 @@ import requests
 import toutv.dl
 import toutv.config
 import toutv.m3u8
+import toutv.net
 
 
 def _clean_description(desc):
@@ -81,8 +82,10 @@ class _Bo:
                 headers['Authorization'] = "Bearer " + token
                 headers['Host'] = "services.radio-canada.ca"
 
-            r = requests.get(url, params=params, headers=headers,
-                             proxies=proxies, timeout=timeout)
+            r = toutv.net.get_session().get(url, params=params,
+                                            headers=headers,
+                                            proxies=proxies,
+                                            timeout=timeout)
             if r.status_code != 200:
                 raise toutv.exceptions.UnexpectedHttpStatusCodeError(url,
                                                                      r.status_code)
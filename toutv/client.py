@@ -34,6 +34,7 @@ import toutv.mapper
 import toutv.transport
 import toutv.config
 import toutv.dl
+import toutv.net
 from toutv import m3u8
 
 
@@ -204,7 +205,8 @@ class Client:
         timeout = 10
 
         try:
-            r = requests.get(url, proxies=self._proxies, timeout=timeout)
+            r = toutv.net.get_session().get(url, proxies=self._proxies,
+                                            timeout=timeout)
             if r.status_code != 200:
                 raise toutv.exceptions.UnexpectedHttpStatusCodeError(url, r.status_code)
         except requests.exceptions.Timeout:
@@ -230,7 +232,9 @@ class Client:
         timeout = 10
 
         try:
-            r = requests.get(episode_url, proxies=self._proxies, timeout=timeout)
+            r = toutv.net.get_session().get(episode_url,
+                                            proxies=self._proxies,
+                                            timeout=timeout)
             if r.status_code != 200:
                 raise toutv.exceptions.UnexpectedHttpStatusCodeError(episode_url, r.status_code)
         except requests.exceptions.Timeout:
@@ -29,15 +29,25 @@
 
 import re
 import os
+import glob
+import zlib
 import errno
+import time
 import struct
 import logging
 import requests
+import threading
 import functools
+import urllib.parse
+import concurrent.futures
 from Crypto.Cipher import AES
 import toutv.config
 import toutv.exceptions
+import toutv.journal
 import toutv.m3u8
+import toutv.metrics
+import toutv.net
+import toutv.retry
 
 
 class DownloadError(RuntimeError):
@@ -72,6 +82,74 @@ class NoSpaceLeftError(DownloadError):
         super().__init__('No space left on device')
 
 
+# errno values meaning that a kernel-side copy is not possible between
+# two given files, in which case we fall back to a simpler method.
+_NO_KERNEL_COPY_ERRNOS = {
+    errno.ENOSYS,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.EPERM,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+}
+
+
+def _append_file(src, dst, chunk_size=1 << 20, kernel_copy=True):
+    """Appends the whole content of the unbuffered file src to the
+    unbuffered file dst, at its current offset.
+
+    When possible, the data is copied by the kernel (copy_file_range(2),
+    then sendfile(2)) without going through Python memory. Otherwise, it
+    is copied by chunks of chunk_size bytes.
+    """
+
+    size = os.fstat(src.fileno()).st_size
+    copied = 0
+
+    if kernel_copy and hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size:
+                n = os.copy_file_range(src.fileno(), dst.fileno(),
+                                       size - copied, copied)
+
+                if n == 0:
+                    break
+
+                copied += n
+        except OSError as e:
+            if e.errno not in _NO_KERNEL_COPY_ERRNOS:
+                raise
+
+    if kernel_copy and copied < size and hasattr(os, 'sendfile'):
+        try:
+            while copied < size:
+                n = os.sendfile(dst.fileno(), src.fileno(), copied,
+                                size - copied)
+
+                if n == 0:
+                    break
+
+                copied += n
+        except OSError as e:
+            if e.errno not in _NO_KERNEL_COPY_ERRNOS:
+                raise
+
+    if copied < size:
+        src.seek(copied)
+
+        while True:
+            chunk = src.read(chunk_size)
+
+            if not chunk:
+                break
+
+            # unbuffered writes may be partial
+            view = memoryview(chunk)
+
+            while view:
+                view = view[dst.write(view):]
+
+
 class SegmentHandler:
 
     def initialize(self):
@@ -107,9 +185,37 @@ class SegmentHandler:
         """Called once all the segments have been successfully downloaded."""
         raise NotImplementedError()
 
+    def partial_segment(self, segindex):
+        """Return the beginning of segment with index segindex, as previously
+        given to on_partial_segment, or None.
+
+        The Downloader asks the segment provider to resume the download of
+        this segment after the returned data instead of downloading it
+        again completely.
+        """
+        return None
+
+    def on_partial_segment(self, segindex, partial):
+        """Called when the download of segment with index segindex was
+        interrupted, partial being the part of the segment which was
+        downloaded.
+
+        The handler may keep this data so that partial_segment returns it
+        when the download is resumed.
+        """
+        pass
+
 
 class FilesystemSegmentHandler(SegmentHandler):
-    """SegmentHandler implementation which saves the episode on the filesystem."""
+    """SegmentHandler implementation which saves the episode on the filesystem.
+
+    Each segment is saved in its own temporary file until the download is
+    complete. A journal (see toutv.journal) records the segments as they
+    are saved, so that resuming a download only needs to read the journal
+    instead of probing the file of each segment.
+    """
+
+    _JOURNAL_LAYOUT = 'segments'
 
     def __init__(self,
                  episode,
@@ -123,6 +229,7 @@ class FilesystemSegmentHandler(SegmentHandler):
 
         self._filename = self._gen_filename()
         self._output_path = os.path.join(self._output_dir, self._filename)
+        self._journal = toutv.journal.DownloadJournal(self._get_journal_path())
 
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -130,6 +237,10 @@ class FilesystemSegmentHandler(SegmentHandler):
     def filename(self):
         return self._filename
 
+    @property
+    def journal_path(self):
+        return self._journal.path
+
     @property
     def output_path(self):
         return self._output_path
@@ -157,29 +268,107 @@ class FilesystemSegmentHandler(SegmentHandler):
 
         return filename
 
+    def _get_temp_file_prefix(self):
+        fmt = '.toutv-{}-{}-{}'
+
+        return fmt.format(self._episode.get_emission().get_id(),
+                          self._episode.get_id(), self._bitrate)
+
     def _get_segment_file_path(self, segindex):
-        fmt = '.toutv-{}-{}-{}-{}.ts'
-        segname = fmt.format(self._episode.get_emission().get_id(),
-                             self._episode.get_id(),
-                             self._bitrate,
-                             segindex)
+        segname = '{}-{}.ts'.format(self._get_temp_file_prefix(), segindex)
 
         return os.path.join(self._output_dir, segname)
 
+    def _get_journal_path(self):
+        journal_name = self._get_temp_file_prefix() + '.journal'
+
+        return os.path.join(self._output_dir, journal_name)
+
+    def _get_journal_header(self):
+        # Segment files and their partial files.
+        temp_globs = [glob.escape(self._get_temp_file_prefix()) + '-*']
+
+        return {
+            'layout': self._JOURNAL_LAYOUT,
+            'emission': self._episode.get_emission().get_id(),
+            'episode': self._episode.get_id(),
+            'bitrate': self._bitrate,
+            'output': self._filename,
+            'temp_globs': temp_globs,
+        }
+
+    def _journal_matches(self):
+        header = self._journal.header
+        expected = self._get_journal_header()
+
+        for key in ['layout', 'emission', 'episode', 'bitrate', 'output']:
+            if header.get(key) != expected[key]:
+                return False
+
+        return True
+
+    def _get_resumable_records(self, records):
+        # Returns the records of a previous download to keep.
+        return list(records.values())
+
+    def _init_journal(self):
+        records = []
+
+        if self._journal.load():
+            if self._journal_matches():
+                records = self._get_resumable_records(self._journal.records)
+                self._logger.debug('resuming from journal "{}" ({} records)'.format(self._journal.path, len(records)))
+            else:
+                self._logger.debug('ignoring journal "{}" of another download'.format(self._journal.path))
+
+        # Rewrite the journal so that it only holds valid records.
+        self._journal.create(self._get_journal_header(), records)
+
+    def _has_partial_segment(self, segindex):
+        record = self._journal.records.get(segindex)
+
+        return record is not None and not record.done
+
+    def _remove_journal(self):
+        try:
+            self._journal.remove()
+        except OSError:
+            # not the end of the world...
+            self._logger.warn('cannot remove journal file "{}"'.format(self._journal.path))
+
+    def _get_partial_segment_file_path(self, segindex):
+        return self._get_segment_file_path(segindex) + '.partial'
+
+    def _remove_partial_segment_file(self, segindex):
+        partial_path = self._get_partial_segment_file_path(segindex)
+
+        if not os.path.isfile(partial_path):
+            return
+
+        self._logger.debug('removing partial segment file "{}"'.format(partial_path))
+
+        try:
+            os.remove(partial_path)
+        except:
+            # not the end of the world...
+            self._logger.warn('cannot remove partial segment file "{}"'.format(partial_path))
+
     def _stitch_segment_files(self, num_segments):
         self._logger.debug('stitching {} segment files'.format(num_segments))
         part_output_path = self._output_path + '.part'
 
-        with open(part_output_path, 'wb') as of:
+        # Unbuffered files, so that the kernel-side copies and the regular
+        # writes share the same file offsets.
+        with open(part_output_path, 'wb', buffering=0) as of:
             for segindex in range(num_segments):
                 segpath = self._get_segment_file_path(segindex)
 
                 if not os.path.isfile(segpath):
                     raise DownloadError('Cannot find segment file "{}"'.format(segpath))
 
-                with open(segpath, 'rb') as segf:
+                with open(segpath, 'rb', buffering=0) as segf:
                     self._logger.debug('concatenating segment file "{}"'.format(segpath))
-                    of.write(segf.read())
+                    _append_file(segf, of)
 
         os.rename(part_output_path, self._output_path)
 
@@ -212,21 +401,24 @@ class FilesystemSegmentHandler(SegmentHandler):
         if not self._overwrite and os.path.exists(self._output_path):
             raise FileExistsError(self._output_path)
 
-    def has_segment(self, segindex):
-        segpath = self._get_segment_file_path(segindex)
-
-        self._logger.debug('segment file path: "{}"'.format(segpath))
+        try:
+            self._init_journal()
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise NoSpaceLeftError()
+            else:
+                raise
 
-        return os.path.isfile(segpath)
+    def has_segment(self, segindex):
+        return self._journal.has_done(segindex)
 
     def segment_size(self, segindex):
-        segpath = self._get_segment_file_path(segindex)
-        statinfo = os.stat(segpath)
-        return statinfo.st_size
+        return self._journal.records[segindex].size
 
     def on_segment(self, segindex, segment):
         segpath = self._get_segment_file_path(segindex)
         partpath = segpath + '.part'
+        had_partial = self._has_partial_segment(segindex)
 
         try:
             # completely write the part file first (could be interrupted)
@@ -236,6 +428,54 @@ class FilesystemSegmentHandler(SegmentHandler):
 
             # rename part file to segment file (should be atomic)
             os.rename(partpath, segpath)
+
+            # the segment is only done once it is in the journal
+            record = toutv.journal.JournalRecord(index=segindex,
+                                                 size=len(segment),
+                                                 crc32=zlib.crc32(segment),
+                                                 offset=None, done=True)
+            self._journal.append(record)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise NoSpaceLeftError()
+            else:
+                raise
+
+        if had_partial:
+            self._remove_partial_segment_file(segindex)
+
+    def partial_segment(self, segindex):
+        if not self._has_partial_segment(segindex):
+            return None
+
+        record = self._journal.records[segindex]
+        partial_path = self._get_partial_segment_file_path(segindex)
+
+        try:
+            with open(partial_path, 'rb') as f:
+                partial = f.read()
+        except FileNotFoundError:
+            return None
+
+        if len(partial) != record.size or zlib.crc32(partial) != record.crc32:
+            self._logger.debug('ignoring corrupted partial segment file "{}"'.format(partial_path))
+            return None
+
+        return partial
+
+    def on_partial_segment(self, segindex, partial):
+        partial_path = self._get_partial_segment_file_path(segindex)
+        self._logger.debug('writing {} bytes to partial segment file "{}"'.format(len(partial), partial_path))
+
+        try:
+            with open(partial_path, 'wb') as f:
+                f.write(partial)
+
+            record = toutv.journal.JournalRecord(index=segindex,
+                                                 size=len(partial),
+                                                 crc32=zlib.crc32(partial),
+                                                 offset=None, done=False)
+            self._journal.append(record)
         except OSError as e:
             if e.errno == errno.ENOSPC:
                 raise NoSpaceLeftError()
@@ -255,6 +495,145 @@ class FilesystemSegmentHandler(SegmentHandler):
             else:
                 raise
 
+        self._remove_journal()
+
+
+class SingleFileSegmentHandler(FilesystemSegmentHandler):
+    """SegmentHandler implementation which appends the segments directly to
+    the output file.
+
+    Segments are appended to a partial output file as they are received,
+    so that there is nothing to stitch at the end. The journal records the
+    offset and size of each written segment so that an interrupted download
+    can be resumed.
+    """
+
+    _JOURNAL_LAYOUT = 'single'
+
+    def __init__(self,
+                 episode,
+                 bitrate,
+                 output_dir,
+                 overwrite=False):
+        super().__init__(episode, bitrate, output_dir, overwrite)
+
+        self._part_output_path = self._output_path + '.part'
+
+        # Number of segments in the partial file, and its size.
+        self._num_segments = 0
+        self._end_offset = 0
+
+    def _get_journal_path(self):
+        return self._output_path + '.part.journal'
+
+    def _get_journal_header(self):
+        header = super()._get_journal_header()
+        header['temp_globs'].append(glob.escape(self._filename) + '.part')
+
+        return header
+
+    def _get_resumable_records(self, records):
+        # Only keep the segments which are, in order, in the partial file
+        # (e.g. not a segment of which the data did not make it to the
+        # partial file), as well as the partial segments.
+        resumable = []
+        end_offset = 0
+
+        try:
+            part_size = os.stat(self._part_output_path).st_size
+        except FileNotFoundError:
+            part_size = 0
+
+        while True:
+            record = records.get(len(resumable))
+
+            if record is None or not record.done:
+                break
+
+            if record.offset != end_offset or end_offset + record.size > part_size:
+                break
+
+            resumable.append(record)
+            end_offset += record.size
+
+        # The last segment is the most likely to be incomplete.
+        if resumable and not self._check_segment(resumable[-1]):
+            end_offset -= resumable.pop().size
+
+        self._num_segments = len(resumable)
+        self._end_offset = end_offset
+
+        for record in records.values():
+            if not record.done and record.index >= self._num_segments:
+                resumable.append(record)
+
+        return resumable
+
+    def _check_segment(self, record):
+        with open(self._part_output_path, 'rb') as f:
+            f.seek(record.offset)
+            data = f.read(record.size)
+
+        return zlib.crc32(data) == record.crc32
+
+    def initialize(self):
+        super().initialize()
+        self._logger.debug('resuming after {} segments ({} bytes)'.format(self._num_segments, self._end_offset))
+
+        try:
+            # Drop anything written after the last complete segment.
+            mode = 'r+b' if self._num_segments else 'wb'
+
+            with open(self._part_output_path, mode) as f:
+                f.truncate(self._end_offset)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise NoSpaceLeftError()
+            else:
+                raise
+
+    def on_segment(self, segindex, segment):
+        if segindex != self._num_segments:
+            tmpl = 'Segment {} received out of order (expecting segment {})'
+            raise DownloadError(tmpl.format(segindex, self._num_segments))
+
+        offset = self._end_offset
+        had_partial = self._has_partial_segment(segindex)
+
+        try:
+            # write the segment data first, then record it in the journal
+            with open(self._part_output_path, 'r+b') as f:
+                self._logger.debug('writing segment {} at offset {} of "{}"'.format(segindex, offset, self._part_output_path))
+                f.seek(offset)
+                f.write(segment)
+
+            record = toutv.journal.JournalRecord(index=segindex,
+                                                 size=len(segment),
+                                                 crc32=zlib.crc32(segment),
+                                                 offset=offset, done=True)
+            self._journal.append(record)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise NoSpaceLeftError()
+            else:
+                raise
+
+        self._num_segments += 1
+        self._end_offset += len(segment)
+
+        if had_partial:
+            self._remove_partial_segment_file(segindex)
+
+    def finalize(self, num_segments):
+        if self._num_segments != num_segments:
+            tmpl = 'Expecting {} segments in "{}", got {}'
+            raise DownloadError(tmpl.format(num_segments,
+                                            self._part_output_path,
+                                            self._num_segments))
+
+        os.rename(self._part_output_path, self._output_path)
+        self._remove_journal()
+
 
 class SegmentProvider:
 
@@ -270,46 +649,224 @@ class SegmentProvider:
     def download_segment(self, segindex, progress):
         raise NotImplementedError()
 
+    def resume_segment(self, segindex, progress, partial):
+        """Download segment with index segindex, of which partial, as
+        returned by partial_segment, is the beginning.
+
+        The default implementation downloads the whole segment again.
+        """
+        return self.download_segment(segindex, progress)
+
+    def partial_segment(self, segindex):
+        """Return the part of segment with index segindex which was
+        downloaded if its download was interrupted, or None."""
+        return None
+
+    def segment_metrics(self, segindex):
+        """Return the toutv.metrics.SegmentMetrics of the last download of
+        segment with index segindex, or None if not available.
+
+        The metrics of a segment are only returned once.
+        """
+        return None
+
+    def refresh(self):
+        """Update the list of segments, possibly waiting until new
+        segments are available. Return False, without waiting, if the list
+        of segments is final.
+
+        Segments are only ever added at the end of the list. The default
+        implementation is for providers of which the list of segments is
+        known by initialize.
+        """
+        return False
+
+    def interrupt(self):
+        """Make the running and future calls of the provider stop as soon
+        as possible, raising CancelledByUserError. May be called from any
+        thread, including while initialize runs.
+
+        The default implementation sets cancel, which the provider checks
+        from time to time.
+        """
+        self.cancel = True
+
     def finalize(self):
         raise NotImplementedError()
 
 
+class _SegmentDecryptor:
+    """Decrypts an AES-CBC encrypted segment chunk by chunk.
+
+    Chunks may have any size: the bytes which do not complete an AES block
+    are kept until the next chunk arrives.
+
+    If iv is None, the first block of the stream is used as the IV and is
+    not part of the plaintext. This is how a CBC stream is decrypted from
+    the middle: the IV of a block is the previous encrypted block.
+    """
+
+    def __init__(self, key, iv=None):
+        self._key = key
+        self._aes = None
+        self._remainder = b''
+
+        if iv is not None:
+            self._aes = AES.new(key, AES.MODE_CBC, iv)
+
+    def decrypt(self, chunk):
+        if self._remainder:
+            chunk = self._remainder + chunk
+
+        if self._aes is None:
+            if len(chunk) < AES.block_size:
+                self._remainder = chunk
+                return b''
+
+            iv = chunk[:AES.block_size]
+            self._aes = AES.new(self._key, AES.MODE_CBC, iv)
+            chunk = chunk[AES.block_size:]
+
+        end = len(chunk) - len(chunk) % AES.block_size
+        self._remainder = chunk[end:]
+
+        if end == 0:
+            return b''
+
+        return self._aes.decrypt(chunk[:end])
+
+    def finalize(self):
+        if self._remainder:
+            raise DownloadError('Encrypted segment size is not a multiple of the AES block size')
+
+
 class ToutvApiSegmentProvider(SegmentProvider):
-    """Segment provider that fetches segments using the Tou.tv API"""
+    """Segment provider that fetches segments using the Tou.tv API
+
+    If rate_limiter (a toutv.ratelimit.RateLimiter) is given, the received
+    bytes are accounted to it, so that the providers sharing it stay under
+    its rate as a whole.
+
+    Live playlists (without an EXT-X-ENDLIST tag) are reloaded by refresh
+    every reload_interval seconds (by default, the target duration of the
+    playlist, or half of it when the last reload found nothing new), and
+    their new segments are added to the list of segments until the
+    playlist ends, or until it stalls for a few reloads.
+
+    All the requests of the provider, including those of initialize, are
+    made in a toutv.net.CancelScope, so that interrupt closes their
+    connections right away.
+
+    Failed segment downloads are retried according to retry_policy (a
+    toutv.retry.RetryPolicy, by default one with default settings). The
+    requests of the provider go through circuit_breaker (a
+    toutv.retry.CircuitBreaker, by default the one shared by the whole
+    process), so that a failing host is left alone for a while by all the
+    downloads instead of being hammered by them.
+    """
 
     _seg_aes_iv = struct.Struct('>IIII')
 
-    def __init__(self, episode, bitrate, proxies=None, timeout=15):
+    # Number of consecutive failed live playlist reloads before giving up.
+    _MAX_RELOAD_ERRORS = 3
+
+    # Number of consecutive live playlist reloads without new segments
+    # after which the playlist is considered ended.
+    _MAX_UNCHANGED_RELOADS = 6
+
+    def __init__(self, episode, bitrate, proxies=None, timeout=15,
+                 rate_limiter=None, reload_interval=None, retry_policy=None,
+                 circuit_breaker=None):
         super().__init__()
 
+        if retry_policy is None:
+            retry_policy = toutv.retry.RetryPolicy()
+
+        if circuit_breaker is None:
+            circuit_breaker = toutv.retry.get_circuit_breaker()
+
         self._episode = episode
         self._bitrate = bitrate
         self._proxies = proxies
         self._timeout = timeout
+        self._rate_limiter = rate_limiter
+        self._reload_interval = reload_interval
+        self._retry_policy = retry_policy
+        self._circuit_breaker = circuit_breaker
 
         self._cookies = None
         self._video_playlist = None
+        self._stream_uri = None
         self._segments = None
-        self._key = None
+
+        # Live playlists: media sequence number of the segment after the
+        # last one of the list, and state of the last reload.
+        self._next_sequence = None
+        self._last_reload = None
+        self._last_reload_changed = True
+        self._reload_errors = 0
+        self._unchanged_reloads = 0
+
+        # Key URI -> decryption key.
+        self._keys = {}
+        self._keys_lock = threading.Lock()
+
+        # Segment index -> beginning of segments of which the download was
+        # interrupted.
+        self._partials = {}
+        self._partials_lock = threading.Lock()
+
+        # Segment index -> metrics of downloaded segments.
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+        self._cancel_scope = toutv.net.CancelScope()
 
         self._logger = logging.getLogger(self.__class__.__name__)
 
-    def _do_request(self, url, params=None, stream=False):
+    def _do_request(self, url, params=None, stream=False, headers=None):
         self._logger.debug('HTTP GET request @ {}'.format(url))
 
-        try:
-            r = requests.get(url, params=params, headers=toutv.config.HEADERS,
-                             proxies=self._proxies, cookies=self._cookies,
-                             timeout=self._timeout, stream=stream)
+        req_headers = dict(toutv.config.HEADERS)
+
+        if headers:
+            req_headers.update(headers)
 
-            if r.status_code != 200:
-                raise toutv.exceptions.UnexpectedHttpStatusCodeError(url,
-                                                                     r.status_code)
+        host = urllib.parse.urlsplit(url).netloc
+        self._circuit_breaker.check(host)
+
+        try:
+            r = toutv.net.get_session().get(url, params=params,
+                                            headers=req_headers,
+                                            proxies=self._proxies,
+                                            cookies=self._cookies,
+                                            timeout=self._timeout,
+                                            stream=stream)
+        except toutv.net.CancelledError:
+            raise CancelledByUserError()
         except requests.exceptions.Timeout:
+            self._circuit_breaker.on_failure(host)
             raise toutv.exceptions.RequestTimeoutError(url, self._timeout)
         except requests.exceptions.ConnectionError as e:
+            # The connection may have been closed by interrupt.
+            if self.cancel:
+                raise CancelledByUserError()
+
+            self._circuit_breaker.on_failure(host)
             raise toutv.exceptions.NetworkError() from e
 
+        if r.status_code >= 500 or r.status_code == 429:
+            self._circuit_breaker.on_failure(host)
+        else:
+            self._circuit_breaker.on_success(host)
+
+        if r.status_code not in (200, 206):
+            retry_after = toutv.retry.parse_retry_after(r.headers.get('Retry-After'))
+            r.close()
+            raise toutv.exceptions.UnexpectedHttpStatusCodeError(url,
+                                                                 r.status_code,
+                                                                 retry_after)
+
         return r
 
     @staticmethod
@@ -320,51 +877,213 @@ class ToutvApiSegmentProvider(SegmentProvider):
 
         raise DownloadError('Cannot find stream for bitrate {} bps'.format(bitrate))
 
-    def _download_segment(self, segindex, progress):
+    def _set_partial(self, segindex, partial):
+        with self._partials_lock:
+            if partial:
+                self._partials[segindex] = partial
+            else:
+                self._partials.pop(segindex, None)
+
+    def _get_key(self, segment):
+        # Return the decryption key of a segment, or None if the segment is
+        # not encrypted. Live playlists may change keys along the way.
+        if segment.key is None:
+            return None
+
+        uri = segment.key.uri
+
+        with self._keys_lock:
+            key = self._keys.get(uri)
+
+        if key is None:
+            key = self._do_request(uri).content
+            self._logger.debug('decryption key: {}'.format(key))
+
+            with self._keys_lock:
+                self._keys[uri] = key
+
+        return key
+
+    def _request_segment(self, segindex, partial):
+        # Request segment with index segindex, resuming after partial if
+        # possible. Return the response, the data already available and a
+        # decryptor, if needed.
+        segment = self._segments[segindex]
+        key = self._get_key(segment)
+
+        if partial and key:
+            # We can only resume after a whole number of AES blocks.
+            partial = partial[:len(partial) - len(partial) % AES.block_size]
+
+        if partial:
+            # When the segment is encrypted, also get the last encrypted
+            # block we have, which is the IV of the next one.
+            begin = len(partial)
+
+            if key:
+                begin -= AES.block_size
+
+            headers = {'Range': 'bytes={}-'.format(begin)}
+
+            try:
+                request = self._do_request(segment.uri, stream=True,
+                                           headers=headers)
+            except toutv.exceptions.UnexpectedHttpStatusCodeError as e:
+                # 416: our partial segment is not what the server has.
+                if e.status_code != 416:
+                    raise
+
+                request = self._do_request(segment.uri, stream=True)
+
+            if request.status_code == 206:
+                tmpl = 'resuming segment {} after {} bytes'
+                self._logger.debug(tmpl.format(segindex, len(partial)))
+                decryptor = None
+
+                if key:
+                    decryptor = _SegmentDecryptor(key)
+
+                return request, bytearray(partial), decryptor
+
+            # The server ignored the range: start over.
+            self._logger.debug('cannot resume segment {}'.format(segindex))
+        else:
+            request = self._do_request(segment.uri, stream=True)
+
+        decryptor = None
+
+        if key:
+            aes_iv = self._seg_aes_iv.pack(0, 0, 0, segindex + 1)
+            decryptor = _SegmentDecryptor(key, aes_iv)
+
+        return request, bytearray(), decryptor
+
+    def _is_cancelled(self):
+        return self.cancel
+
+    def _download_segment(self, segindex, progress, metrics, partial=None):
         self._logger.debug('downloading segment {}'.format(segindex))
 
-        encrypted_ts_segment = bytearray()
-        chunks_count = 0
-        num_bytes = 0
+        # Keep what we have if the request fails.
+        self._set_partial(segindex, partial)
 
         # Obtain the URI to download this segment.
-        segment = self._segments[segindex]
-        request = self._do_request(segment.uri, stream=True)
+        request, ts_segment, decryptor = self._request_segment(segindex,
+                                                               partial)
+        metrics.mark_first_byte()
+        chunks_count = 0
+        num_bytes = len(ts_segment)
+
+        if ts_segment and decryptor:
+            # The first block we receive is the IV, which we already have.
+            num_bytes -= AES.block_size
+
+        try:
+            # Fetch by chunks of 8 kiB
+            for chunk in request.iter_content(8192):
+                if self.cancel:
+                    raise CancelledByUserError()
+
+                # Wait for our share of the bandwidth, if it is limited.
+                if self._rate_limiter is not None:
+                    if not self._rate_limiter.consume(len(chunk),
+                                                      self._is_cancelled):
+                        raise CancelledByUserError()
+
+                # Decrypt the segment as it arrives, if needed.
+                if decryptor:
+                    begin = time.perf_counter()
+                    ts_segment += decryptor.decrypt(chunk)
+                    metrics.decrypt_time += time.perf_counter() - begin
+                else:
+                    ts_segment += chunk
+
+                num_bytes += len(chunk)
+
+                # Every 32 chunks (256 kiB), we notify of our progress.
+                if chunks_count % 32 == 0:
+                    progress(num_bytes)
+
+                chunks_count += 1
+
+            # An interrupted transfer may look like a complete one.
+            if self.cancel:
+                raise CancelledByUserError()
+        except requests.exceptions.RequestException as e:
+            self._set_partial(segindex, ts_segment)
 
-        # Fetch by chunks of 8 kiB
-        for chunk in request.iter_content(8192):
             if self.cancel:
                 raise CancelledByUserError()
 
-            encrypted_ts_segment += chunk
-            num_bytes += len(chunk)
+            host = urllib.parse.urlsplit(self._segments[segindex].uri).netloc
+            self._circuit_breaker.on_failure(host)
+            raise toutv.exceptions.NetworkError() from e
+        except:
+            self._set_partial(segindex, ts_segment)
+            raise
 
-            # Every 32 chunks (256 kiB), we notify of our progress.
-            if chunks_count % 32 == 0:
-                progress(num_bytes)
+        metrics.mark_last_byte()
 
-            chunks_count += 1
+        if decryptor:
+            decryptor.finalize()
 
-        # We have the whole segment, decrypt it if needed.
-        if self._key:
-            aes_iv = self._seg_aes_iv.pack(0, 0, 0, segindex + 1)
-            aes = AES.new(self._key, AES.MODE_CBC, aes_iv)
-            ts_segment = aes.decrypt(bytes(encrypted_ts_segment))
-        else:
-            ts_segment = bytes(encrypted_ts_segment)
+        self._set_partial(segindex, None)
 
         return ts_segment
 
-    def _download_segment_with_retry(self, segindex, progress, num_tries=3):
-        for i in range(num_tries):
+    def _download_segment_with_retry(self, segindex, progress, partial=None):
+        metrics = toutv.metrics.SegmentMetrics(segindex)
+        metrics.start()
+        num_tries = 0
+
+        while True:
+            num_tries += 1
+
             try:
-                return self._download_segment(segindex, progress)
-            except toutv.exceptions.NetworkError:
-                # If it was our last retry, give up and propagate the exception.
-                if i + 1 == num_tries:
+                segment = self._download_segment(segindex, progress, metrics,
+                                                 partial)
+                break
+            except toutv.exceptions.NetworkError as e:
+                # Give up and propagate the exception if the policy says so.
+                if not self._retry_policy.should_retry(num_tries, e):
                     raise
 
+                delay = self._retry_policy.get_delay(num_tries, e)
+                tmpl = 'cannot download segment {} ({}); retrying in {:.1f} s'
+                self._logger.info(tmpl.format(segindex, e, delay))
+                self._sleep_until(time.monotonic() + delay)
+
+                # Resume after what we got so far.
+                partial = self.partial_segment(segindex)
+                metrics.retries += 1
+
+        metrics.num_bytes = len(segment)
+
+        with self._metrics_lock:
+            self._metrics[segindex] = metrics
+
+        return segment
+
+    def _in_cancel_scope(self, func, *args):
+        # Call func in our cancel scope, so that interrupt stops its
+        # requests right away.
+        try:
+            with self._cancel_scope:
+                return func(*args)
+        except CancelledByUserError:
+            raise
+        except Exception as e:
+            # Whatever interrupted requests raised (they may not go through
+            # _do_request).
+            if self.cancel:
+                raise CancelledByUserError() from e
+
+            raise
+
     def initialize(self):
+        self._in_cancel_scope(self._initialize)
+
+    def _initialize(self):
         self._logger.debug('episode: {}'.format(self._episode))
         self._logger.debug('bitrate: {}'.format(self._bitrate))
         self._logger.debug('timeout: {}'.format(self._timeout))
@@ -376,106 +1095,461 @@ class ToutvApiSegmentProvider(SegmentProvider):
         stream = self._get_video_stream(playlist, self._bitrate)
 
         # get video playlist
-        m3u8_file = self._do_request(stream.uri).text
-        self._video_playlist = toutv.m3u8.parse(m3u8_file,
-                                                os.path.dirname(stream.uri))
-        self._segments = self._video_playlist.segments
+        self._stream_uri = stream.uri
+        self._segments = []
+        self._next_sequence = None
+        self._load_video_playlist()
         self._logger.debug('parsed M3U8 file: {} total segments'.format(self.num_segments()))
 
+        if not self._is_playlist_ended():
+            self._logger.debug('live playlist')
+
         # get decryption key
-        if self._segments[0].key:
-            uri = self._segments[0].key.uri
-            self._key = self._do_request(uri).content
-            self._logger.debug('decryption key: {}'.format(self._key))
+        if self._segments and self._segments[0].key:
+            self._get_key(self._segments[0])
         else:
             self._logger.debug('no decryption key found')
 
+    def _load_video_playlist(self):
+        # (Re)load the video playlist and add its new segments to our list.
+        # Return the number of new segments.
+        m3u8_file = self._do_request(self._stream_uri).text
+        playlist = toutv.m3u8.parse(m3u8_file,
+                                    os.path.dirname(self._stream_uri))
+        self._video_playlist = playlist
+        self._last_reload = time.monotonic()
+
+        first_sequence = playlist.media_sequence
+
+        if self._next_sequence is None:
+            self._next_sequence = first_sequence
+        elif first_sequence > self._next_sequence:
+            # We reloaded too late: segments left the playlist.
+            tmpl = 'missed {} segments of the live playlist'
+            self._logger.warning(tmpl.format(first_sequence - self._next_sequence))
+
+        num_new_segments = 0
+
+        for i, segment in enumerate(playlist.segments):
+            if first_sequence + i >= self._next_sequence:
+                self._segments.append(segment)
+                num_new_segments += 1
+
+        end_sequence = first_sequence + len(playlist.segments)
+        self._next_sequence = max(self._next_sequence, end_sequence)
+
+        return num_new_segments
+
+    def _get_reload_interval(self):
+        if self._reload_interval is not None:
+            return self._reload_interval
+
+        interval = max(self._video_playlist.target_duration, 1)
+
+        if not self._last_reload_changed:
+            interval /= 2
+
+        return interval
+
+    def _wait_reload(self):
+        self._sleep_until(self._last_reload + self._get_reload_interval())
+
+    def _sleep_until(self, deadline):
+        # Sleep until the monotonic time deadline, unless cancelled.
+        while True:
+            if self.cancel:
+                raise CancelledByUserError()
+
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                return
+
+            time.sleep(min(remaining, .1))
+
+    def _is_playlist_ended(self):
+        if self._video_playlist.ended:
+            return True
+
+        # VOD playlists cannot change, even without EXT-X-ENDLIST.
+        if self._video_playlist.playlist_type == 'VOD':
+            return True
+
+        return self._unchanged_reloads >= self._MAX_UNCHANGED_RELOADS
+
     def num_segments(self):
         return len(self._segments)
 
+    def refresh(self):
+        return self._in_cancel_scope(self._refresh)
+
+    def _refresh(self):
+        if self._is_playlist_ended():
+            return False
+
+        self._wait_reload()
+
+        try:
+            num_new_segments = self._load_video_playlist()
+        except toutv.exceptions.NetworkError:
+            # A live event may outlive a short network failure.
+            self._reload_errors += 1
+
+            if self._reload_errors >= self._MAX_RELOAD_ERRORS:
+                raise
+
+            self._logger.warning('cannot reload live playlist; will retry')
+            self._last_reload = time.monotonic()
+            self._last_reload_changed = False
+
+            return True
+
+        self._reload_errors = 0
+        self._last_reload_changed = num_new_segments > 0
+
+        if self._last_reload_changed:
+            self._unchanged_reloads = 0
+        else:
+            self._unchanged_reloads += 1
+
+            if self._is_playlist_ended():
+                self._logger.warning('live playlist stalled; considering it ended')
+
+        self._logger.debug('live playlist reloaded: {} new segments'.format(num_new_segments))
+
+        return True
+
     def download_segment(self, segindex, progress):
-        return self._download_segment_with_retry(segindex, progress)
+        return self._in_cancel_scope(self._download_segment_with_retry,
+                                     segindex, progress)
+
+    def resume_segment(self, segindex, progress, partial):
+        return self._in_cancel_scope(self._download_segment_with_retry,
+                                     segindex, progress, partial)
+
+    def interrupt(self):
+        super().interrupt()
+        self._cancel_scope.cancel()
+
+    def partial_segment(self, segindex):
+        with self._partials_lock:
+            return self._partials.pop(segindex, None)
+
+    def segment_metrics(self, segindex):
+        with self._metrics_lock:
+            return self._metrics.pop(segindex, None)
 
     def finalize(self):
         pass
 
 
+class ConcurrencyLimiter:
+    """Limits the number of segments being fetched at the same time by one
+    or more Downloader objects.
+
+    The same limiter may be shared by all the downloads of a process so
+    that they run under a global concurrency budget. Its limit may be
+    changed at any time.
+    """
+
+    def __init__(self, limit):
+        self._limit = max(1, limit)
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def active(self):
+        return self._active
+
+    def set_limit(self, limit):
+        with self._cond:
+            self._limit = max(1, limit)
+            self._cond.notify_all()
+
+    def acquire(self, timeout=None):
+        """Wait until a segment may be fetched. Return False if this is
+        still not the case after timeout seconds."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._active < self._limit,
+                                       timeout):
+                return False
+
+            self._active += 1
+
+            return True
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+
 class Downloader:
 
     def __init__(self,
                  seg_provider,
                  seg_handler,
                  on_progress_update=None,
-                 on_dl_start=None):
+                 on_dl_start=None,
+                 num_workers=1,
+                 limiter=None,
+                 on_segment_metrics=None,
+                 on_num_segments_update=None):
         self._seg_provider = seg_provider
         self._seg_handler = seg_handler
 
         self._on_progress_update = on_progress_update
         self._on_dl_start = on_dl_start
+        self._on_segment_metrics = on_segment_metrics
+        self._on_num_segments_update = on_num_segments_update
+
+        # Number of segments fetched concurrently, possibly further limited
+        # by a limiter shared with other downloads.
+        self._num_workers = max(1, num_workers)
+        self._limiter = limiter
+
+        # Protects the progress state below, which is updated both by the
+        # worker threads and by the thread calling download().
+        self._progress_lock = threading.Lock()
+        self._num_segments = None
+        self._done_segments = 0
+        self._done_segment_bytes = 0
+        self._partial_bytes = {}
 
         self._do_cancel = False
         self._logger = logging.getLogger(self.__class__.__name__)
 
+    @property
+    def num_segments(self):
+        """Number of segments to download, or None if not known yet."""
+        return self._num_segments
+
+    @property
+    def done_segments(self):
+        return self._done_segments
+
+    @property
+    def done_bytes(self):
+        """Number of bytes downloaded so far, including the segments being
+        downloaded."""
+        with self._progress_lock:
+            return self._done_segment_bytes + sum(self._partial_bytes.values())
+
     def cancel(self):
         self._logger.info('cancelling download')
-        self._seg_provider.cancel = True
         self._do_cancel = True
+        self._seg_provider.interrupt()
 
     def _notify_dl_start(self, num_segments):
         if self._on_dl_start:
             self._on_dl_start(num_segments)
 
+    def _notify_num_segments_update(self, num_segments):
+        self._num_segments = num_segments
+
+        if self._on_num_segments_update:
+            self._on_num_segments_update(num_segments)
+
     def _notify_progress_update(self, num_completed_segments, num_bytes,
                                 num_bytes_partial_segment):
         if self._on_progress_update:
             self._on_progress_update(num_completed_segments, num_bytes,
                                      num_bytes_partial_segment)
 
+    def _notify_segment_metrics(self, segindex, num_bytes, write_time):
+        # Always take the provider's metrics, so that it does not keep them.
+        metrics = self._seg_provider.segment_metrics(segindex)
+
+        if not self._on_segment_metrics:
+            return
+
+        if metrics is None:
+            metrics = toutv.metrics.SegmentMetrics(segindex)
+            metrics.num_bytes = num_bytes
+
+        metrics.write_time = write_time
+        self._on_segment_metrics(metrics)
+
+    def _on_segment_progress(self, segindex, num_bytes):
+        # Called by the segment provider, possibly from a worker thread, to
+        # notify of progress during the fetching of a segment.
+        with self._progress_lock:
+            self._partial_bytes[segindex] = num_bytes
+            self._notify_progress_update(self._done_segments,
+                                         self._done_segment_bytes,
+                                         sum(self._partial_bytes.values()))
+
+    def _on_segment_done(self, segindex, num_bytes):
+        with self._progress_lock:
+            self._partial_bytes.pop(segindex, None)
+            self._done_segments = segindex + 1
+            self._done_segment_bytes += num_bytes
+            self._notify_progress_update(self._done_segments,
+                                         self._done_segment_bytes,
+                                         sum(self._partial_bytes.values()))
+
+    def _on_segment_skipped(self, segindex, num_bytes):
+        with self._progress_lock:
+            self._done_segments = segindex + 1
+            self._done_segment_bytes += num_bytes
+
+    def _acquire_limiter(self):
+        # Wait for our turn, checking for cancellation from time to time.
+        while not self._limiter.acquire(timeout=.1):
+            if self._do_cancel or self._seg_provider.cancel:
+                raise CancelledByUserError()
+
+    def _fetch_segment(self, segindex):
+        if self._limiter is None:
+            return self._fetch_segment_unlimited(segindex)
+
+        self._acquire_limiter()
+
+        try:
+            return self._fetch_segment_unlimited(segindex)
+        finally:
+            self._limiter.release()
+
+    def _fetch_segment_unlimited(self, segindex):
+        progress = functools.partial(self._on_segment_progress, segindex)
+        partial = self._seg_handler.partial_segment(segindex)
+
+        if partial:
+            return self._seg_provider.resume_segment(segindex, progress,
+                                                     partial)
+
+        return self._seg_provider.download_segment(segindex, progress)
+
+    def _schedule_segments(self, executor, pending, num_segments):
+        # Submit segments to fetch until we have as many in flight as we
+        # have workers. Segments the handler already has are skipped.
+        while (self._next_segindex < num_segments and
+               len(pending) < self._num_workers):
+            segindex = self._next_segindex
+            self._next_segindex += 1
+
+            if self._seg_handler.has_segment(segindex):
+                self._logger.debug('segment handler already has segment {}; skipping'.format(segindex))
+                continue
+
+            pending[segindex] = executor.submit(self._fetch_segment, segindex)
+
+    def _abort_pending(self, pending):
+        # Make the in-flight segments stop as soon as possible and drop the
+        # ones which were not started yet.
+        self._seg_provider.interrupt()
+
+        for future in pending.values():
+            future.cancel()
+
+    def _save_partial_segments(self, segindexes):
+        # Give the segment handler what we got of the segments which were
+        # being downloaded so that they may be resumed later.
+        for segindex in segindexes:
+            partial = self._seg_provider.partial_segment(segindex)
+
+            if not partial:
+                continue
+
+            try:
+                self._seg_handler.on_partial_segment(segindex, partial)
+            except Exception as e:
+                tmpl = 'cannot save partial segment {}: {}'
+                self._logger.warning(tmpl.format(segindex, e))
+
+    def _refresh_segments(self, num_segments):
+        # Return the new number of segments, or None if it is final.
+        if not self._seg_provider.refresh():
+            return None
+
+        new_num_segments = self._seg_provider.num_segments()
+
+        if new_num_segments != num_segments:
+            self._notify_num_segments_update(new_num_segments)
+
+        return new_num_segments
+
+    def _download_segments(self, num_segments):
+        # Segments are fetched by a pool of workers, but handed to the
+        # segment handler in order. Return the final number of segments,
+        # which may grow during the download (live playlists).
+        pending = {}
+        self._next_segindex = 0
+        segindex = 0
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self._num_workers) as executor:
+                try:
+                    while True:
+                        if self._do_cancel:
+                            raise CancelledByUserError()
+
+                        if segindex == num_segments:
+                            new_num_segments = self._refresh_segments(num_segments)
+
+                            if new_num_segments is None:
+                                return num_segments
+
+                            num_segments = new_num_segments
+                            continue
+
+                        self._schedule_segments(executor, pending,
+                                                num_segments)
+
+                        if segindex not in pending:
+                            size = self._seg_handler.segment_size(segindex)
+                            self._on_segment_skipped(segindex, size)
+                            segindex += 1
+                            continue
+
+                        # Get the segment.
+                        segment = pending[segindex].result()
+                        del pending[segindex]
+
+                        # Update running sum of bytes and notify of progress.
+                        self._on_segment_done(segindex, len(segment))
+
+                        # Do something with the segment.
+                        begin = time.perf_counter()
+                        self._seg_handler.on_segment(segindex, segment)
+                        write_time = time.perf_counter() - begin
+                        self._notify_segment_metrics(segindex, len(segment),
+                                                     write_time)
+                        segindex += 1
+                except:
+                    self._abort_pending(pending)
+                    raise
+        except:
+            # At this point, all the workers are done.
+            self._save_partial_segments(pending)
+            raise
+
     def download(self):
         self._logger.debug('starting download')
 
         self._seg_provider.initialize()
+
+        if self._do_cancel:
+            raise CancelledByUserError()
+
         self._seg_handler.initialize()
 
         # Get the number of segments.
         num_segments = self._seg_provider.num_segments()
 
         # Notify of the download start.
+        self._num_segments = num_segments
         self._notify_dl_start(num_segments)
 
         # Do an initial progress update before we begin.
         self._notify_progress_update(0, 0, 0)
 
-        # Number of bytes in the completely downloaded segments.
-        done_segment_bytes = 0
-
         try:
-            for segindex in range(num_segments):
-
-                if self._do_cancel:
-                    raise CancelledByUserError()
-
-                if self._seg_handler.has_segment(segindex):
-                    self._logger.debug('segment handler already has segment; skipping')
-                    done_segment_bytes += self._seg_handler.segment_size(segindex)
-                    continue
-
-                # Function called by the segment provider to notify of progress
-                # during the fetching of a segment.
-                progress = functools.partial(self._notify_progress_update,
-                                             segindex, done_segment_bytes)
-
-                # Get the segment.
-                segment = self._seg_provider.download_segment(segindex, progress)
-
-                # Update running sum of bytes.
-                done_segment_bytes += len(segment)
-
-                # Notify of progress.
-                self._notify_progress_update(segindex + 1, done_segment_bytes, 0)
-
-                # Do something with the segment.
-                self._seg_handler.on_segment(segindex, segment)
+            num_segments = self._download_segments(num_segments)
 
             # All the segments were fetched.
             self._seg_provider.finalize()
@@ -51,9 +51,10 @@ class RequestTimeoutError(NetworkError):
 
 class UnexpectedHttpStatusCodeError(NetworkError):
 
-    def __init__(self, url, status_code):
+    def __init__(self, url, status_code, retry_after=None):
         self._url = url
         self._status_code = status_code
+        self._retry_after = retry_after
 
     @property
     def url(self):
@@ -63,6 +64,30 @@ class UnexpectedHttpStatusCodeError(NetworkError):
     def status_code(self):
         return self._status_code
 
+    @property
+    def retry_after(self):
+        # Delay (seconds) of the Retry-After header of the response, if any.
+        return self._retry_after
+
     def __str__(self):
         tmpl = 'Unexpected HTTP response code {} for "{}"'
         return tmpl.format(self._status_code, self._url)
+
+
+class CircuitOpenError(NetworkError):
+
+    def __init__(self, host, retry_after):
+        self._host = host
+        self._retry_after = retry_after
+
+    @property
+    def host(self):
+        return self._host
+
+    @property
+    def retry_after(self):
+        return self._retry_after
+
+    def __str__(self):
+        tmpl = 'Too many failed requests to {}; not trying again for {:.0f} s'
+        return tmpl.format(self._host, self._retry_after)
@@ -0,0 +1,225 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# Copyright (c) 2014, Philippe Proulx <eepp.ca>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn OR Philippe Proulx
+# BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import glob
+import json
+import collections
+
+
+# A record of the journal. size and crc32 are those of the segment data
+# (or of what was received so far if done is False). offset is the
+# position of the segment in the output file, if relevant.
+JournalRecord = collections.namedtuple('JournalRecord',
+                                       ['index', 'size', 'crc32', 'offset',
+                                        'done'])
+
+
+class DownloadJournal:
+    """Journal of the segments of a download.
+
+    The journal is a text file made of JSON lines: a header describing the
+    download, followed by one record per segment event, appended as they
+    happen. Each record is written with a single write, so that an
+    interrupted download leaves at most one torn line at the end of the
+    file, which is ignored when loading. When a segment has multiple
+    records, the last one wins.
+
+    The header is a dict provided by the user of the journal, to which the
+    journal adds its format version. By convention, the "temp_globs" entry
+    holds glob patterns (relative to the journal's directory) of the
+    temporary files of the download.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self._path = path
+        self._header = None
+        self._records = {}
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def header(self):
+        return self._header
+
+    @property
+    def records(self):
+        """Last record of each segment, by segment index."""
+        return self._records
+
+    def has_done(self, index):
+        record = self._records.get(index)
+
+        return record is not None and record.done
+
+    def load(self):
+        """Loads the journal from its file.
+
+        Returns False if the file does not exist or is not a journal of
+        a supported version.
+        """
+
+        self._header = None
+        self._records = {}
+
+        try:
+            with open(self._path, 'rb') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return False
+
+        if not lines:
+            return False
+
+        try:
+            header = json.loads(lines[0].decode())
+        except ValueError:
+            return False
+
+        if not isinstance(header, dict) or header.get('version') != DownloadJournal.VERSION:
+            return False
+
+        self._header = header
+
+        for line in lines[1:]:
+            # A line without its newline was not completely written.
+            if not line.endswith(b'\n'):
+                break
+
+            try:
+                record = DownloadJournal._parse_record(line)
+            except (ValueError, KeyError, TypeError):
+                break
+
+            self._records[record.index] = record
+
+        return True
+
+    @staticmethod
+    def _parse_record(line):
+        obj = json.loads(line.decode())
+
+        record = JournalRecord(index=int(obj['index']),
+                               size=int(obj['size']),
+                               crc32=int(obj['crc32']),
+                               offset=obj.get('offset'),
+                               done=bool(obj['done']))
+
+        if record.offset is not None:
+            record = record._replace(offset=int(record.offset))
+
+        return record
+
+    @staticmethod
+    def _format_record(record):
+        obj = {
+            'index': record.index,
+            'size': record.size,
+            'crc32': record.crc32,
+            'done': record.done,
+        }
+
+        if record.offset is not None:
+            obj['offset'] = record.offset
+
+        return json.dumps(obj, sort_keys=True) + '\n'
+
+    def create(self, header, records=()):
+        """Replaces the journal file by a new one with the given header and
+        records.
+
+        The new file is completely written before it replaces the old one.
+        """
+
+        header = dict(header)
+        header['version'] = DownloadJournal.VERSION
+        lines = [json.dumps(header, sort_keys=True) + '\n']
+        new_records = {}
+
+        for record in records:
+            lines.append(DownloadJournal._format_record(record))
+            new_records[record.index] = record
+
+        tmp_path = self._path + '.tmp'
+
+        with open(tmp_path, 'w') as f:
+            f.write(''.join(lines))
+
+        os.replace(tmp_path, self._path)
+        self._header = header
+        self._records = new_records
+
+    def append(self, record):
+        """Appends a record to the journal file."""
+
+        line = DownloadJournal._format_record(record).encode()
+
+        # Single unbuffered write: the record is either completely in the
+        # file, or torn at the end of it.
+        with open(self._path, 'ab', buffering=0) as f:
+            f.write(line)
+
+        self._records[record.index] = record
+
+    def remove(self):
+        os.remove(self._path)
+
+    def temp_paths(self):
+        """Returns the existing temporary files of the download, according
+        to the temp_globs entry of the header."""
+
+        directory = os.path.dirname(self._path)
+        paths = []
+
+        for pattern in self._header.get('temp_globs', []):
+            paths += glob.glob(os.path.join(directory, pattern))
+
+        return sorted(set(paths))
+
+
+def find_journals(directory):
+    """Returns the loaded download journals found in directory."""
+
+    journals = []
+
+    # Temporary files of downloads may be hidden.
+    paths = glob.glob(os.path.join(directory, '*.journal'))
+    paths += glob.glob(os.path.join(directory, '.*.journal'))
+
+    for path in sorted(paths):
+        journal = DownloadJournal(path)
+
+        if journal.load():
+            journals.append(journal)
+
+    return journals
@@ -0,0 +1,168 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# Copyright (c) 2014, Philippe Proulx <eepp.ca>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn OR Philippe Proulx
+# BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import json
+import time
+import threading
+import collections
+
+
+# An episode in the library. quality is the quality setting which chose
+# bitrate, or None if the bitrate was explicitly requested. completed is
+# the time at which the download completed.
+LibraryEntry = collections.namedtuple('LibraryEntry',
+                                      ['emission_id', 'episode_id', 'bitrate',
+                                       'pid', 'quality', 'path', 'size',
+                                       'completed'])
+
+
+class Library:
+    """Index of the downloaded episodes.
+
+    The index is a text file made of JSON lines, one per downloaded
+    episode, appended as downloads complete; when an episode has multiple
+    entries for the same bitrate and PID, the last one wins. The file is
+    loaded once, and the entries are kept in a dict keyed by emission and
+    episode ID, so that looking up an episode does not need anything but
+    its IDs.
+
+    Instances may be used concurrently by multiple threads.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+
+        # (emission ID, episode ID) -> {(bitrate, PID): entry}
+        self._entries = {}
+        self._load()
+
+    @property
+    def path(self):
+        return self._path
+
+    @staticmethod
+    def _parse_entry(line):
+        obj = json.loads(line.decode())
+        bitrate = obj['bitrate']
+
+        return LibraryEntry(emission_id=str(obj['emission_id']),
+                            episode_id=str(obj['episode_id']),
+                            bitrate=int(bitrate) if bitrate is not None else None,
+                            pid=obj.get('pid'),
+                            quality=obj.get('quality'),
+                            path=obj['path'],
+                            size=int(obj['size']),
+                            completed=float(obj['completed']))
+
+    def _load(self):
+        try:
+            with open(self._path, 'rb') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+
+        for line in lines:
+            # A line without its newline was not completely written.
+            if not line.endswith(b'\n'):
+                break
+
+            try:
+                entry = Library._parse_entry(line)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+
+            self._put(entry)
+
+    def _put(self, entry):
+        key = (entry.emission_id, entry.episode_id)
+        self._entries.setdefault(key, {})[(entry.bitrate, entry.pid)] = entry
+
+    @staticmethod
+    def _is_present(entry):
+        # The downloaded file must still be there, complete.
+        try:
+            return os.path.getsize(entry.path) == entry.size
+        except OSError:
+            return False
+
+    def find(self, emission_id, episode_id, bitrate=None, quality=None,
+             pid=None):
+        """Returns the entry of an episode whose file is still present, or
+        None.
+
+        If bitrate is None, the entry must have been downloaded with the
+        quality setting quality instead. If pid is None, the PID of the
+        entry is not checked (episode listings do not always include it).
+        """
+
+        with self._lock:
+            entries = self._entries.get((str(emission_id), str(episode_id)))
+
+            if not entries:
+                return None
+
+            entries = list(entries.values())
+
+        for entry in entries:
+            if pid is not None and entry.pid is not None and entry.pid != pid:
+                continue
+
+            if bitrate is not None:
+                if entry.bitrate != bitrate:
+                    continue
+            elif entry.quality is None or entry.quality != quality:
+                continue
+
+            if Library._is_present(entry):
+                return entry
+
+        return None
+
+    def add(self, emission_id, episode_id, bitrate, pid, quality, path):
+        """Adds the downloaded file path of an episode to the library and
+        returns its entry."""
+
+        entry = LibraryEntry(emission_id=str(emission_id),
+                             episode_id=str(episode_id), bitrate=bitrate,
+                             pid=pid, quality=quality,
+                             path=os.path.abspath(path),
+                             size=os.path.getsize(path),
+                             completed=time.time())
+        line = json.dumps(entry._asdict(), sort_keys=True) + '\n'
+
+        with self._lock:
+            # Single unbuffered write, like the download journals.
+            with open(self._path, 'ab', buffering=0) as f:
+                f.write(line.encode())
+
+            self._put(entry)
+
+        return entry
@@ -132,7 +132,7 @@ class Playlist:
     """An M3U8 playlist."""
 
     def __init__(self, target_duration, media_sequence, allow_cache,
-                 playlist_type, version, streams, segments):
+                 playlist_type, version, streams, segments, ended=False):
         self.target_duration = target_duration
         self.media_sequence = media_sequence
         self.allow_cache = allow_cache
@@ -141,6 +141,9 @@ class Playlist:
         self.streams = streams
         self.segments = segments
 
+        # False for live playlists, to which segments may be added.
+        self.ended = ended
+
 
 def _validate(lines):
     return lines[0].strip() == SIGNATURE
@@ -174,6 +177,7 @@ def parse(data, base_uri):
     media_sequence = 0
     version = 0
     playlist_type = None
+    ended = False
     lines = data.split('\n')
 
     if not _validate(lines):
@@ -221,6 +225,8 @@ def parse(data, base_uri):
             streams.append(stream)
         elif tagname == Tags.EXT_X_VERSION:
             version = attributes
+        elif tagname == Tags.EXT_X_ENDLIST:
+            ended = True
         elif tagname == Tags.EXTINF:
             duration, title = attributes.split(',')
             segment = Segment()
@@ -236,4 +242,4 @@ def parse(data, base_uri):
             continue
 
     return Playlist(target_duration, media_sequence, allow_cache,
-                    playlist_type, version, streams, segments)
+                    playlist_type, version, streams, segments, ended)
@@ -0,0 +1,260 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# Copyright (c) 2014, Philippe Proulx <eepp.ca>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn OR Philippe Proulx
+# BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import json
+import time
+import threading
+
+
+class SegmentMetrics:
+    """Timings of the download of one segment.
+
+    request_start is the wall clock time (seconds since the epoch) at
+    which the first request for the segment was sent. first_byte and
+    last_byte are the times, relative to request_start, at which the
+    response headers and the last byte of the last try were received.
+    decrypt_time and write_time are the total times spent decrypting the
+    segment and handing it to the segment handler. retries is the number
+    of tries after the first one.
+
+    Timings which were not measured are None.
+    """
+
+    def __init__(self, segindex):
+        self.segindex = segindex
+        self.num_bytes = 0
+        self.request_start = None
+        self.first_byte = None
+        self.last_byte = None
+        self.decrypt_time = 0
+        self.write_time = None
+        self.retries = 0
+        self._start = None
+
+    def start(self):
+        self.request_start = time.time()
+        self._start = time.perf_counter()
+
+    def _elapsed(self):
+        if self._start is None:
+            return None
+
+        return time.perf_counter() - self._start
+
+    def mark_first_byte(self):
+        self.first_byte = self._elapsed()
+
+    def mark_last_byte(self):
+        self.last_byte = self._elapsed()
+
+    def to_dict(self):
+        return {
+            'segment': self.segindex,
+            'bytes': self.num_bytes,
+            'request_start': self.request_start,
+            'first_byte': self.first_byte,
+            'last_byte': self.last_byte,
+            'decrypt_time': self.decrypt_time,
+            'write_time': self.write_time,
+            'retries': self.retries,
+        }
+
+
+class JsonLinesMetricsWriter:
+    """Writes the metrics of each segment as a JSON line, as soon as it is
+    recorded.
+
+    Labels given to record() (e.g. the name of the download) are added to
+    the line. Instances may be used concurrently by multiple threads.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    @property
+    def path(self):
+        return self._path
+
+    def record(self, metrics, **labels):
+        obj = dict(labels)
+        obj.update(metrics.to_dict())
+        line = json.dumps(obj, sort_keys=True) + '\n'
+
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _escape_label_value(value):
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+    return value.replace('\n', '\\n')
+
+
+class PrometheusMetricsWriter:
+    """Aggregates the metrics of the segments by labels and writes them in
+    the Prometheus text exposition format.
+
+    The file is replaced (atomically) at most once every interval seconds
+    while metrics are recorded, and when the writer is closed, so that it
+    can be exported by the textfile collector of the node exporter.
+    Instances may be used concurrently by multiple threads.
+    """
+
+    # (name, type, help) of each metric
+    _METRICS = [
+        ('toutv_segments_total', 'counter',
+         'Number of downloaded segments'),
+        ('toutv_segment_bytes_total', 'counter',
+         'Number of bytes of the downloaded segments'),
+        ('toutv_segment_retries_total', 'counter',
+         'Number of segment request retries'),
+        ('toutv_segment_first_byte_seconds', 'summary',
+         'Time between the segment request and its first byte'),
+        ('toutv_segment_transfer_seconds', 'summary',
+         'Time between the first and last bytes of a segment'),
+        ('toutv_segment_decrypt_seconds', 'summary',
+         'Time spent decrypting a segment'),
+        ('toutv_segment_write_seconds', 'summary',
+         'Time spent handing a segment to the segment handler'),
+    ]
+
+    def __init__(self, path, interval=10):
+        self._path = path
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._last_write = time.monotonic()
+
+        # Sorted label items -> metric name -> value, or [sum, count] for
+        # summaries.
+        self._values = {}
+
+    @property
+    def path(self):
+        return self._path
+
+    def _add(self, values, name, value):
+        if value is None:
+            return
+
+        if name.endswith('_total'):
+            values[name] = values.get(name, 0) + value
+        else:
+            summary = values.setdefault(name, [0, 0])
+            summary[0] += value
+            summary[1] += 1
+
+    def record(self, metrics, **labels):
+        key = tuple(sorted(labels.items()))
+        transfer = None
+
+        if metrics.first_byte is not None and metrics.last_byte is not None:
+            transfer = metrics.last_byte - metrics.first_byte
+
+        with self._lock:
+            values = self._values.setdefault(key, {})
+            self._add(values, 'toutv_segments_total', 1)
+            self._add(values, 'toutv_segment_bytes_total', metrics.num_bytes)
+            self._add(values, 'toutv_segment_retries_total', metrics.retries)
+            self._add(values, 'toutv_segment_first_byte_seconds', metrics.first_byte)
+            self._add(values, 'toutv_segment_transfer_seconds', transfer)
+            self._add(values, 'toutv_segment_decrypt_seconds', metrics.decrypt_time)
+            self._add(values, 'toutv_segment_write_seconds', metrics.write_time)
+
+            if time.monotonic() - self._last_write >= self._interval:
+                self._write()
+
+    def text(self):
+        with self._lock:
+            return self._text()
+
+    def _text(self):
+        lines = []
+
+        for name, metric_type, help in PrometheusMetricsWriter._METRICS:
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+
+            for key in sorted(self._values):
+                value = self._values[key].get(name)
+
+                if value is None:
+                    continue
+
+                labels = ','.join('{}="{}"'.format(k, _escape_label_value(v))
+                                  for k, v in key)
+
+                if labels:
+                    labels = '{' + labels + '}'
+
+                if metric_type == 'summary':
+                    lines.append('{}_sum{} {}'.format(name, labels, value[0]))
+                    lines.append('{}_count{} {}'.format(name, labels, value[1]))
+                else:
+                    lines.append('{}{} {}'.format(name, labels, value))
+
+        return '\n'.join(lines) + '\n'
+
+    def _write(self):
+        tmp_path = self._path + '.tmp'
+
+        with open(tmp_path, 'w') as f:
+            f.write(self._text())
+
+        os.replace(tmp_path, self._path)
+        self._last_write = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._write()
+
+
+WRITERS = {
+    'jsonl': JsonLinesMetricsWriter,
+    'prometheus': PrometheusMetricsWriter,
+}
+
+
+def open_writer(path, fmt='jsonl'):
+    """Returns a metrics writer for the format fmt (a key of WRITERS)
+    writing to path."""
+
+    try:
+        writer_cls = WRITERS[fmt]
+    except KeyError:
+        raise ValueError('Unknown metrics format: "{}"'.format(fmt))
+
+    return writer_cls(path)
@@ -0,0 +1,290 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# Copyright (c) 2014, Philippe Proulx <eepp.ca>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn OR Philippe Proulx
+# BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import socket
+import weakref
+import threading
+import http.cookiejar
+import requests
+import requests.adapters
+import urllib3.connectionpool
+import urllib3.poolmanager
+
+
+class CancelledError(Exception):
+    """Raised by the requests started in a cancelled CancelScope."""
+
+    def __str__(self):
+        return 'Request cancelled'
+
+
+_local = threading.local()
+
+
+def get_cancel_scope():
+    """Returns the innermost CancelScope entered by the calling thread, or
+    None."""
+
+    scopes = getattr(_local, 'scopes', None)
+
+    if not scopes:
+        return None
+
+    return scopes[-1]
+
+
+class CancelScope:
+    """Scope in which HTTP requests may be interrupted at once.
+
+    Threads enter the scope with a with statement. While they are in it,
+    the connections used by their requests (made through an HttpSession)
+    are tracked by the scope. cancel(), which may be called from any
+    thread, shuts down the sockets of these connections, so that the
+    threads blocked on them get an error right away instead of after the
+    request timeout, and makes the requests started in the scope
+    afterwards raise CancelledError. The same scope may be entered by
+    multiple threads at the same time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conns = weakref.WeakSet()
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def __enter__(self):
+        if not hasattr(_local, 'scopes'):
+            _local.scopes = []
+
+        _local.scopes.append(self)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.scopes.pop()
+
+    def _add(self, conn):
+        with self._lock:
+            if self._cancelled:
+                raise CancelledError()
+
+            self._conns.add(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._conns.discard(conn)
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            conns = list(self._conns)
+
+        for conn in conns:
+            sock = getattr(conn, 'sock', None)
+
+            if sock is None:
+                continue
+
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # Already closed.
+                pass
+
+
+class _ScopedPoolMixin:
+
+    # Connection pool which adds the connections it hands out to the
+    # cancel scope of the calling thread, until they are put back.
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        scope = get_cancel_scope()
+
+        if scope is not None:
+            try:
+                scope._add(conn)
+            except CancelledError:
+                self._put_conn(conn)
+                raise
+
+            conn.toutv_cancel_scope = scope
+
+        return conn
+
+    def _put_conn(self, conn):
+        scope = getattr(conn, 'toutv_cancel_scope', None)
+
+        if scope is not None:
+            scope._discard(conn)
+            conn.toutv_cancel_scope = None
+
+        super()._put_conn(conn)
+
+
+class _ScopedHTTPConnectionPool(_ScopedPoolMixin,
+                                urllib3.connectionpool.HTTPConnectionPool):
+    pass
+
+
+class _ScopedHTTPSConnectionPool(_ScopedPoolMixin,
+                                 urllib3.connectionpool.HTTPSConnectionPool):
+    pass
+
+
+_SCOPED_POOL_CLASSES = {
+    'http': _ScopedHTTPConnectionPool,
+    'https': _ScopedHTTPSConnectionPool,
+}
+
+
+class _ScopedHTTPAdapter(requests.adapters.HTTPAdapter):
+
+    @staticmethod
+    def _use_scoped_pools(manager):
+        # Leave alone managers with their own pools (SOCKS proxies).
+        if manager.pool_classes_by_scheme is urllib3.poolmanager.pool_classes_by_scheme:
+            manager.pool_classes_by_scheme = _SCOPED_POOL_CLASSES
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self._use_scoped_pools(self.poolmanager)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        manager = super().proxy_manager_for(*args, **kwargs)
+        self._use_scoped_pools(manager)
+
+        return manager
+
+
+class HttpSession:
+    """Pooled, keep-alive HTTP session.
+
+    All the HTTP requests of the library go through an instance of this
+    class, so that TCP and TLS connections to the same host are reused
+    instead of being established for each request. Instances may be used
+    concurrently by multiple threads.
+
+    pool_size is the maximum number of connections kept alive per host,
+    retries is the number of times a request is retried when the
+    connection cannot be established, and timeout is the default timeout
+    (seconds) of requests which do not specify one.
+
+    Requests made in a CancelScope may be interrupted by cancelling it.
+    """
+
+    def __init__(self, pool_size=10, retries=2, timeout=15):
+        self._pool_size = pool_size
+        self._retries = retries
+        self._timeout = timeout
+
+        self._session = requests.Session()
+
+        # Cookies are always explicitly passed to requests and read from
+        # responses: never keep any in the shared session.
+        policy = http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+        self._session.cookies.set_policy(policy)
+
+        # Only retry failed connection attempts: the request was not sent.
+        max_retries = requests.adapters.Retry(total=retries, read=False,
+                                              redirect=False,
+                                              raise_on_redirect=False)
+        adapter = _ScopedHTTPAdapter(pool_maxsize=pool_size,
+                                     max_retries=max_retries)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def retries(self):
+        return self._retries
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def request(self, method, url, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self._timeout
+
+        return self._session.request(method, url, timeout=timeout, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self._session.close()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Returns the HTTP session shared by the whole process, creating it
+    with default settings if needed."""
+
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = HttpSession()
+
+        return _session
+
+
+def set_session(session):
+    """Sets the HTTP session shared by the whole process."""
+
+    global _session
+
+    with _session_lock:
+        old_session = _session
+        _session = session
+
+    # Requests already using the old session may complete.
+    if old_session is not None and old_session is not session:
+        old_session.close()
+
+
+def configure(pool_size=10, retries=2, timeout=15):
+    """Replaces the HTTP session shared by the whole process with a new one
+    having the given settings."""
+
+    set_session(HttpSession(pool_size=pool_size, retries=retries,
+                            timeout=timeout))
@@ -0,0 +1,156 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# Copyright (c) 2014, Philippe Proulx <eepp.ca>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn OR Philippe Proulx
+# BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import re
+import time
+import threading
+
+
+class RateLimiter:
+    """Token bucket limiting the rate at which bytes are transferred.
+
+    A single instance is meant to be shared by all the downloads of a
+    process, so that their total bandwidth stays under the limit. Up to
+    burst bytes may be transferred at once after a quiet period, after
+    which the transfer proceeds at rate bytes per second. Instances may be
+    used concurrently by multiple threads.
+
+    A rate of 0 or None means no limit. The rate may be changed at any
+    time with set_rate(), including while other threads are waiting.
+    """
+
+    # Maximum time (seconds) to wait before checking should_stop again.
+    _MAX_WAIT = .1
+
+    def __init__(self, rate=None, burst=None):
+        self._cond = threading.Condition()
+        self._rate = None
+        self._burst = None
+        self._tokens = 0
+        self._last_time = time.monotonic()
+        self.set_rate(rate, burst)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def burst(self):
+        return self._burst
+
+    def set_rate(self, rate, burst=None):
+        """Sets the rate (bytes/second) and the burst size (bytes).
+
+        The burst size defaults to one second worth of transfer.
+        """
+
+        if not rate:
+            rate = None
+            burst = None
+        elif burst is None:
+            burst = rate
+
+        with self._cond:
+            self._refill()
+
+            if burst is not None:
+                # Going from unlimited to limited starts with a full
+                # bucket; otherwise, keep what is left, up to the new burst
+                # size.
+                if self._rate is None:
+                    self._tokens = burst
+                else:
+                    self._tokens = min(self._tokens, burst)
+
+            self._rate = rate
+            self._burst = burst
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+
+        if self._rate is not None:
+            tokens = self._tokens + (now - self._last_time) * self._rate
+            self._tokens = min(tokens, self._burst)
+
+        self._last_time = now
+
+    def consume(self, num_bytes, should_stop=None):
+        """Waits until num_bytes may be transferred.
+
+        If should_stop is given, it is called periodically while waiting;
+        if it returns True, the wait is abandoned and this method returns
+        False. Otherwise, True is returned.
+        """
+
+        with self._cond:
+            while True:
+                self._refill()
+
+                if self._rate is None:
+                    return True
+
+                # A chunk larger than the bucket is let through once the
+                # bucket is full, leaving it in debt.
+                needed = min(num_bytes, self._burst)
+
+                if self._tokens >= needed:
+                    self._tokens -= num_bytes
+                    return True
+
+                if should_stop is not None and should_stop():
+                    return False
+
+                wait = (needed - self._tokens) / self._rate
+                self._cond.wait(min(wait, RateLimiter._MAX_WAIT))
+
+
+_rate_re = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kKmMgG]?)\s*$')
+
+_rate_units = {
+    '': 1,
+    'k': 1 << 10,
+    'm': 1 << 20,
+    'g': 1 << 30,
+}
+
+
+def parse_rate(rate):
+    """Parses a rate such as "500k" or "2M" and returns it in bytes per
+    second. Suffixes are binary multiples. Raises ValueError if the rate is
+    invalid."""
+
+    m = _rate_re.match(rate)
+
+    if not m:
+        raise ValueError('Invalid rate: "{}"'.format(rate))
+
+    value = float(m.group(1)) * _rate_units[m.group(2).lower()]
+
+    return int(value)
@@ -0,0 +1,199 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# Copyright (c) 2014, Philippe Proulx <eepp.ca>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn OR Philippe Proulx
+# BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import time
+import random
+import threading
+import email.utils
+import toutv.exceptions
+
+
+def parse_retry_after(value, now=None):
+    """Returns the delay (seconds) of a Retry-After header value, either a
+    number of seconds or an HTTP date, or None if it is invalid."""
+
+    if value is None:
+        return None
+
+    value = value.strip()
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+    if now is None:
+        now = time.time()
+
+    return max(date.timestamp() - now, 0.)
+
+
+class RetryPolicy:
+    """Policy deciding if and when a failed request is tried again.
+
+    A request is tried at most max_tries times. Network errors, timeouts
+    and responses with a status code in retry_statuses are retried. The
+    delay before try n + 1 is drawn uniformly between (1 - jitter) and 1
+    times min(max_delay, base_delay * 2 ** (n - 1)), so that the clients
+    which failed together do not retry together; when the server gives a
+    Retry-After delay, it is used instead, up to max_retry_after seconds.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_tries=5, base_delay=.5, max_delay=30, jitter=.5,
+                 retry_statuses=RETRY_STATUSES, max_retry_after=120,
+                 rng=None):
+        self._max_tries = max(1, max_tries)
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._jitter = min(max(jitter, 0), 1)
+        self._retry_statuses = frozenset(retry_statuses)
+        self._max_retry_after = max_retry_after
+        self._rng = rng if rng is not None else random.Random()
+
+    @property
+    def max_tries(self):
+        return self._max_tries
+
+    def is_retryable(self, error):
+        if isinstance(error, toutv.exceptions.UnexpectedHttpStatusCodeError):
+            return error.status_code in self._retry_statuses
+
+        return isinstance(error, toutv.exceptions.NetworkError)
+
+    def should_retry(self, num_tries, error):
+        """Returns True if a request which failed with error after num_tries
+        tries should be tried again."""
+
+        return num_tries < self._max_tries and self.is_retryable(error)
+
+    def get_delay(self, num_tries, error=None):
+        """Returns the delay (seconds) before trying again a request which
+        failed with error after num_tries tries."""
+
+        retry_after = getattr(error, 'retry_after', None)
+
+        if retry_after is not None:
+            return min(retry_after, self._max_retry_after)
+
+        delay = min(self._max_delay,
+                    self._base_delay * 2 ** (num_tries - 1))
+
+        return delay * (1 - self._jitter * self._rng.random())
+
+
+class CircuitBreaker:
+    """Per-host circuit breaker.
+
+    After failure_threshold consecutive failed requests to a host, its
+    circuit opens: requests to it are refused right away (check raises
+    CircuitOpenError) for reset_timeout seconds. A single request is then
+    let through; the circuit closes if it succeeds, and opens again if it
+    fails. The same instance is meant to be shared by all the downloads of
+    a process, and may be used concurrently by multiple threads.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=15,
+                 clock=time.monotonic):
+        self._failure_threshold = max(1, failure_threshold)
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        # Host -> [consecutive failures, time of opening, trial running]
+        self._hosts = {}
+
+    def is_open(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+
+            return state is not None and state[1] is not None
+
+    def check(self, host):
+        """Raises CircuitOpenError if a request to host must not be
+        made now."""
+
+        with self._lock:
+            state = self._hosts.get(host)
+
+            if state is None or state[1] is None:
+                return
+
+            remaining = state[1] + self._reset_timeout - self._clock()
+
+            if remaining <= 0 and not state[2]:
+                # Let this one through to probe the host.
+                state[2] = True
+                return
+
+            retry_in = remaining if remaining > 0 else self._reset_timeout
+            raise toutv.exceptions.CircuitOpenError(host, retry_in)
+
+    def on_success(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def on_failure(self, host):
+        with self._lock:
+            state = self._hosts.setdefault(host, [0, None, False])
+            state[0] += 1
+
+            if state[2] or state[0] >= self._failure_threshold:
+                state[1] = self._clock()
+                state[2] = False
+
+
+_circuit_breaker = None
+_circuit_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """Returns the circuit breaker shared by the whole process, creating it
+    with default settings if needed."""
+
+    global _circuit_breaker
+
+    with _circuit_breaker_lock:
+        if _circuit_breaker is None:
+            _circuit_breaker = CircuitBreaker()
+
+        return _circuit_breaker
+
+
+def set_circuit_breaker(circuit_breaker):
+    """Sets the circuit breaker shared by the whole process."""
+
+    global _circuit_breaker
+
+    with _circuit_breaker_lock:
+        _circuit_breaker = circuit_breaker
@@ -0,0 +1,342 @@
+"""Local HTTP server serving a synthetic HLS episode.
+
+The server mimics what the Tou.tv servers give to ToutvApiSegmentProvider:
+a master playlist listing one variant playlist per bitrate, the AES key,
+and the AES-128 encrypted TS segments of each variant. It can inject
+latency, limit the bandwidth of each response, and inject errors, so
+that the download path can be tested and measured without hitting
+Tou.tv.
+
+Usage:
+
+    with HlsServer(num_segments=20) as server:
+        episode = server.make_episode()
+        provider = dl.ToutvApiSegmentProvider(episode, server.bitrates[0])
+        ...
+        assert data == server.episode_data(server.bitrates[0])
+"""
+
+import os
+import re
+import math
+import time
+import random
+import struct
+import threading
+import http.server
+import socketserver
+from Crypto.Cipher import AES
+from toutv import bos
+
+
+_SEG_AES_IV = struct.Struct('>IIII')
+_SEGMENT_RE = re.compile(r'^/(\d+)/segment-(\d+)\.ts$')
+_VARIANT_RE = re.compile(r'^/(\d+)/index\.m3u8$')
+_RANGE_RE = re.compile(r'^bytes=(\d+)-$')
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server.hls_server
+        server._count_request(self.path)
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        path = self.path.split('?', 1)[0]
+
+        if path == '/master.m3u8':
+            self._send_body(server.master_playlist().encode())
+            return
+
+        if path == '/key':
+            self._send_body(server.key)
+            return
+
+        m = _VARIANT_RE.match(path)
+
+        if m and int(m.group(1)) in server.bitrates:
+            self._send_body(server.variant_playlist(int(m.group(1))).encode())
+            return
+
+        m = _SEGMENT_RE.match(path)
+
+        if m:
+            bitrate = int(m.group(1))
+            segindex = int(m.group(2))
+
+            if bitrate in server.bitrates and segindex < server.num_available_segments():
+                self._send_segment(bitrate, segindex)
+                return
+
+        self._send_error(404)
+
+    def _send_error(self, status, retry_after=None):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+
+        self.end_headers()
+
+    def _send_segment(self, bitrate, segindex):
+        server = self.server.hls_server
+
+        if server._should_inject(server.error_rate):
+            self._send_error(503, server.retry_after)
+            return
+
+        data = server.encrypted_segment(bitrate, segindex)
+        status = 200
+        begin = 0
+        range_header = self.headers.get('Range')
+
+        if range_header:
+            m = _RANGE_RE.match(range_header)
+
+            if not m or int(m.group(1)) >= len(data):
+                self._send_error(416)
+                return
+
+            status = 206
+            begin = int(m.group(1))
+
+        body = data[begin:]
+        truncate = server._should_inject(server.truncate_rate)
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/MP2T')
+        self.send_header('Content-Length', str(len(body)))
+
+        if status == 206:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(begin, len(data) - 1, len(data)))
+
+        self.end_headers()
+
+        if truncate:
+            # Send half of the body, then drop the connection.
+            self._write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+
+        self._write(body)
+
+    def _send_body(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self._write(body)
+
+    def _write(self, data):
+        server = self.server.hls_server
+
+        if not server.bandwidth:
+            self.wfile.write(data)
+            return
+
+        # Send chunks of 1/20 s worth of data at the configured rate.
+        chunk_size = max(server.bandwidth // 20, 1)
+        begin_time = time.monotonic()
+
+        for begin in range(0, len(data), chunk_size):
+            self.wfile.write(data[begin:begin + chunk_size])
+            expected_time = (begin + chunk_size) / server.bandwidth
+            delay = expected_time - (time.monotonic() - begin_time)
+
+            if delay > 0:
+                time.sleep(delay)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, hls_server):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.hls_server = hls_server
+
+
+class _LocalEpisode(bos.Episode):
+
+    def __init__(self, playlist_url):
+        super().__init__()
+        self._playlist_url = playlist_url
+
+    def _get_playlist_url(self):
+        return self._playlist_url
+
+
+def make_episode(master_url):
+    """Returns an episode of which the master playlist is at master_url."""
+
+    emission = bos.Emission()
+    emission.Id = 1
+    emission.Title = 'Local'
+
+    episode = _LocalEpisode(master_url)
+    episode.Id = 1
+    episode.Title = 'HLS'
+    episode.set_emission(emission)
+
+    return episode
+
+
+class HlsServer:
+    """Local HLS server.
+
+    num_segments segments of segment_size bytes (rounded to the AES block
+    size) are served for each bitrate of bitrates. latency (seconds) is
+    added to each response, bandwidth (bytes/second) limits the rate of
+    each response, error_rate is the probability that a segment request
+    is answered with a 503 status code (with a Retry-After header of
+    retry_after seconds, if not None), and truncate_rate the probability
+    that the connection is dropped in the middle of a segment. Errors are
+    drawn from a generator seeded with seed.
+
+    If live is True, the episode is served like a live event which started
+    when the server started: a new segment becomes available every
+    segment_duration seconds, the variant playlists only list the last
+    window available segments (all of them if window is None), and they
+    only end once all the segments are available.
+    """
+
+    def __init__(self, num_segments=10, segment_size=188 * 1024,
+                 bitrates=(500000, 1000000), segment_duration=10,
+                 latency=0, bandwidth=None, error_rate=0, truncate_rate=0,
+                 seed=0, live=False, window=None, retry_after=None):
+        self.num_segments = num_segments
+        self.segment_size = segment_size - segment_size % AES.block_size
+        self.bitrates = list(bitrates)
+        self.segment_duration = segment_duration
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.retry_after = retry_after
+        self.live = live
+        self.window = window
+        self.key = os.urandom(16)
+        self._start_time = None
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._request_counts = {}
+        self._segments = {}
+        self._server = None
+        self._thread = None
+
+        # Generate everything beforehand, so that the server itself does
+        # not use CPU time while being measured.
+        for bitrate in self.bitrates:
+            for segindex in range(num_segments):
+                plaintext = os.urandom(self.segment_size)
+                iv = _SEG_AES_IV.pack(0, 0, 0, segindex + 1)
+                ciphertext = AES.new(self.key, AES.MODE_CBC, iv).encrypt(plaintext)
+                self._segments[(bitrate, segindex)] = (plaintext, ciphertext)
+
+    def __enter__(self):
+        self.start()
+
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self._start_time = time.monotonic()
+        self._server = _Server(self)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_port)
+
+    @property
+    def master_url(self):
+        return self.url + '/master.m3u8'
+
+    def master_playlist(self):
+        lines = ['#EXTM3U']
+
+        for bitrate in self.bitrates:
+            lines.append('#EXT-X-STREAM-INF:PROGRAM-ID=1,BANDWIDTH={},RESOLUTION=640x360,CODECS="avc1.66.30, mp4a.40.5"'.format(bitrate))
+            lines.append('{}/index.m3u8'.format(bitrate))
+
+        return '\n'.join(lines) + '\n'
+
+    def num_available_segments(self):
+        if not self.live:
+            return self.num_segments
+
+        elapsed = time.monotonic() - self._start_time
+        num_segments = 1 + int(elapsed / self.segment_duration)
+
+        return min(num_segments, self.num_segments)
+
+    def variant_playlist(self, bitrate):
+        end = self.num_available_segments()
+        begin = 0
+
+        if self.window is not None:
+            begin = max(0, end - self.window)
+
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-TARGETDURATION:{}'.format(math.ceil(self.segment_duration)),
+            '#EXT-X-MEDIA-SEQUENCE:{}'.format(begin),
+            '#EXT-X-KEY:METHOD=AES-128,URI="{}/key"'.format(self.url),
+        ]
+
+        for segindex in range(begin, end):
+            lines.append('#EXTINF:{},'.format(self.segment_duration))
+            lines.append('segment-{}.ts'.format(segindex))
+
+        if end == self.num_segments:
+            lines.append('#EXT-X-ENDLIST')
+
+        return '\n'.join(lines) + '\n'
+
+    def encrypted_segment(self, bitrate, segindex):
+        return self._segments[(bitrate, segindex)][1]
+
+    def segment(self, bitrate, segindex):
+        return self._segments[(bitrate, segindex)][0]
+
+    def episode_data(self, bitrate):
+        """Returns the expected content of the downloaded episode."""
+        return b''.join(self.segment(bitrate, segindex)
+                        for segindex in range(self.num_segments))
+
+    def make_episode(self):
+        """Returns an episode of which the playlist is served by this
+        server."""
+        return make_episode(self.master_url)
+
+    def request_count(self, path):
+        with self._lock:
+            return self._request_counts.get(path, 0)
+
+    def _count_request(self, path):
+        with self._lock:
+            self._request_counts[path] = self._request_counts.get(path, 0) + 1
+
+    def _should_inject(self, rate):
+        if not rate:
+            return False
+
+        with self._lock:
+            return self._random.random() < rate
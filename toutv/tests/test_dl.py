@@ -1,5 +1,16 @@
+import os
+import time
+import threading
+import tempfile
 import unittest
+import requests
+from Crypto.Cipher import AES
+from toutv import bos
 from toutv import dl
+from toutv import exceptions
+from toutv import m3u8
+from toutv import retry
+from toutv.tests import hls_server
 
 
 class DummySegmentProvider(dl.SegmentProvider):
@@ -29,6 +40,135 @@ class DummySegmentProvider(dl.SegmentProvider):
         pass
 
 
+class SlowDummySegmentProvider(DummySegmentProvider):
+
+    def __init__(self):
+        super().__init__()
+        self._segments = [bytes([i]) * 4 for i in range(16)]
+
+    def download_segment(self, segindex, progress):
+        # Make early segments slower so that they complete out of order.
+        time.sleep(0.001 * (len(self._segments) - segindex))
+
+        return super().download_segment(segindex, progress)
+
+
+class CountingDummySegmentProvider(SlowDummySegmentProvider):
+
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def download_segment(self, segindex, progress):
+        cls = CountingDummySegmentProvider
+
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+
+        try:
+            return super().download_segment(segindex, progress)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+class FailingDummySegmentProvider(DummySegmentProvider):
+
+    def __init__(self, fail_segindex):
+        super().__init__()
+        self._fail_segindex = fail_segindex
+        self.downloaded = []
+
+    def download_segment(self, segindex, progress):
+        if segindex == self._fail_segindex:
+            raise dl.DownloadError('Cannot download segment')
+
+        self.downloaded.append(segindex)
+
+        return super().download_segment(segindex, progress)
+
+
+class InterruptedDummySegmentProvider(DummySegmentProvider):
+
+    def __init__(self, interrupted_segindex):
+        super().__init__()
+        self._interrupted_segindex = interrupted_segindex
+        self._partials = {}
+        self.resumed = {}
+
+    def download_segment(self, segindex, progress):
+        if segindex == self._interrupted_segindex:
+            self._partials[segindex] = self._segments[segindex][:2]
+            raise exceptions.NetworkError()
+
+        return super().download_segment(segindex, progress)
+
+    def resume_segment(self, segindex, progress, partial):
+        self.resumed[segindex] = partial
+
+        return super().download_segment(segindex, progress)
+
+    def partial_segment(self, segindex):
+        return self._partials.pop(segindex, None)
+
+
+class _FakeResponse:
+
+    def __init__(self, status_code, data, fail_after=None):
+        self.status_code = status_code
+        self._data = data
+        self._fail_after = fail_after
+
+    def iter_content(self, chunk_size):
+        for begin in range(0, len(self._data), chunk_size):
+            if self._fail_after is not None and begin >= self._fail_after:
+                raise requests.exceptions.ConnectionError()
+
+            yield self._data[begin:begin + chunk_size]
+
+
+class FakeApiSegmentProvider(dl.ToutvApiSegmentProvider):
+
+    def __init__(self, key, ciphertext, fail_after):
+        super().__init__(None, 0)
+        segment = m3u8.Segment()
+        segment.uri = 'segment.ts'
+        segment.key = m3u8.Key()
+        segment.key.uri = 'key'
+        self._segments = [segment]
+        self._keys = {'key': key}
+        self._ciphertext = ciphertext
+        self._fail_after = fail_after
+        self.range_begins = []
+
+    def _do_request(self, url, params=None, stream=False, headers=None):
+        if headers and 'Range' in headers:
+            begin = int(headers['Range'][6:-1])
+            self.range_begins.append(begin)
+
+            return _FakeResponse(206, self._ciphertext[begin:])
+
+        fail_after = self._fail_after
+        self._fail_after = None
+
+        return _FakeResponse(200, self._ciphertext, fail_after)
+
+
+def _make_episode():
+    emission = bos.Emission()
+    emission.Id = 1234
+    emission.Title = 'Emission'
+
+    episode = bos.Episode()
+    episode.Id = 5678
+    episode.Title = 'Episode'
+    episode.SeasonAndEpisode = 'S01E01'
+    episode.set_emission(emission)
+
+    return episode
+
+
 class DummySegmentHandler(dl.SegmentHandler):
 
     def __init__(self):
@@ -61,6 +201,32 @@ class DlTest(unittest.TestCase):
         downloader.download()
         assert seg_provider._segments == seg_handler._segments
 
+    def test_concurrent_download(self):
+        seg_provider = SlowDummySegmentProvider()
+        seg_handler = DummySegmentHandler()
+        downloader = dl.Downloader(seg_provider, seg_handler, num_workers=4)
+        downloader.download()
+        assert seg_provider._segments == seg_handler._segments
+
+    def test_shared_limiter(self):
+        limiter = dl.ConcurrencyLimiter(3)
+        downloaders = []
+
+        for i in range(3):
+            downloader = dl.Downloader(CountingDummySegmentProvider(),
+                                       DummySegmentHandler(), num_workers=4,
+                                       limiter=limiter)
+            downloaders.append(threading.Thread(target=downloader.download))
+
+        for thread in downloaders:
+            thread.start()
+
+        for thread in downloaders:
+            thread.join()
+
+        assert CountingDummySegmentProvider.max_active <= 3
+        assert limiter.active == 0
+
     def test_on_progress_update(self):
 
         seg_provider = DummySegmentProvider()
@@ -95,4 +261,297 @@ class DlTest(unittest.TestCase):
         p = Progress()
 
         downloader = dl.Downloader(seg_provider, seg_handler, on_progress_update=p.progress)
-        downloader.download()
\ No newline at end of file
+        downloader.download()
+
+
+class FilesystemSegmentHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_download(self):
+        seg_handler = dl.FilesystemSegmentHandler(_make_episode(), 1000000,
+                                                  self._tmpdir.name)
+        dl.Downloader(DummySegmentProvider(), seg_handler).download()
+
+        with open(seg_handler.output_path, 'rb') as f:
+            assert f.read() == b'abcdefghijklmnop'
+
+        assert os.listdir(self._tmpdir.name) == [seg_handler.filename]
+
+    def _test_append_file(self, kernel_copy):
+        data = os.urandom(100000)
+        src_path = os.path.join(self._tmpdir.name, 'src')
+        dst_path = os.path.join(self._tmpdir.name, 'dst')
+
+        with open(src_path, 'wb') as f:
+            f.write(data)
+
+        with open(dst_path, 'wb', buffering=0) as dst:
+            dst.write(b'head')
+
+            with open(src_path, 'rb', buffering=0) as src:
+                dl._append_file(src, dst, chunk_size=4096,
+                                kernel_copy=kernel_copy)
+
+            dst.write(b'tail')
+
+        with open(dst_path, 'rb') as f:
+            assert f.read() == b'head' + data + b'tail'
+
+    def test_append_file_kernel_copy(self):
+        self._test_append_file(True)
+
+    def test_append_file_chunked(self):
+        self._test_append_file(False)
+
+    def test_resume_partial_segment(self):
+        seg_provider = InterruptedDummySegmentProvider(2)
+        seg_handler = dl.FilesystemSegmentHandler(_make_episode(), 1000000,
+                                                  self._tmpdir.name)
+
+        with self.assertRaises(dl.DownloadError):
+            dl.Downloader(seg_provider, seg_handler).download()
+
+        seg_provider = InterruptedDummySegmentProvider(None)
+        dl.Downloader(seg_provider, seg_handler).download()
+        assert seg_provider.resumed == {2: b'ij'}
+
+        with open(seg_handler.output_path, 'rb') as f:
+            assert f.read() == b'abcdefghijklmnop'
+
+        assert os.listdir(self._tmpdir.name) == [seg_handler.filename]
+
+    def test_resume_from_journal(self):
+        seg_provider = FailingDummySegmentProvider(2)
+
+        with self.assertRaises(dl.DownloadError):
+            dl.Downloader(seg_provider, dl.FilesystemSegmentHandler(
+                _make_episode(), 1000000, self._tmpdir.name)).download()
+
+        # Only the segments recorded in the journal are done.
+        os.remove(os.path.join(self._tmpdir.name, '.toutv-1234-5678-1000000-0.ts'))
+        seg_handler = dl.FilesystemSegmentHandler(_make_episode(), 1000000,
+                                                  self._tmpdir.name)
+        seg_handler.initialize()
+        assert seg_handler.has_segment(0)
+        assert seg_handler.segment_size(1) == 4
+        assert not seg_handler.has_segment(2)
+
+
+class ToutvApiSegmentProviderTest(unittest.TestCase):
+
+    def test_resume_encrypted_segment(self):
+        key = os.urandom(16)
+        iv = dl.ToutvApiSegmentProvider._seg_aes_iv.pack(0, 0, 0, 1)
+        plaintext = os.urandom(100000 - 100000 % 16)
+        ciphertext = AES.new(key, AES.MODE_CBC, iv).encrypt(plaintext)
+
+        # The connection breaks after 3 chunks of 8 kiB.
+        seg_provider = FakeApiSegmentProvider(key, ciphertext, 20000)
+        segment = seg_provider.download_segment(0, lambda num_bytes: None)
+        assert segment == plaintext
+
+        # Resumed from the last received block, which is the next IV.
+        assert seg_provider.range_begins == [3 * 8192 - 16]
+
+
+class SingleFileSegmentHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._episode = _make_episode()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _make_handler(self):
+        return dl.SingleFileSegmentHandler(self._episode, 1000000,
+                                           self._tmpdir.name)
+
+    def test_download(self):
+        seg_handler = self._make_handler()
+        dl.Downloader(DummySegmentProvider(), seg_handler).download()
+
+        with open(seg_handler.output_path, 'rb') as f:
+            assert f.read() == b'abcdefghijklmnop'
+
+        assert os.listdir(self._tmpdir.name) == [seg_handler.filename]
+
+    def test_resume(self):
+        seg_provider = FailingDummySegmentProvider(2)
+
+        with self.assertRaises(dl.DownloadError):
+            dl.Downloader(seg_provider, self._make_handler()).download()
+
+        # Simulate a partially written segment after the last journal entry.
+        seg_handler = self._make_handler()
+
+        with open(seg_handler.output_path + '.part', 'ab') as f:
+            f.write(b'garbage')
+
+        seg_provider = FailingDummySegmentProvider(None)
+        dl.Downloader(seg_provider, seg_handler).download()
+        assert seg_provider.downloaded == [2, 3]
+
+        with open(seg_handler.output_path, 'rb') as f:
+            assert f.read() == b'abcdefghijklmnop'
+
+
+class HlsServerDownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _download(self, server, num_workers=1, on_segment_metrics=None,
+                  retry_policy=None, circuit_breaker=None):
+        bitrate = server.bitrates[-1]
+        episode = server.make_episode()
+
+        if retry_policy is None:
+            retry_policy = retry.RetryPolicy(max_tries=10, base_delay=.01)
+
+        if circuit_breaker is None:
+            circuit_breaker = retry.CircuitBreaker(failure_threshold=100)
+
+        seg_provider = dl.ToutvApiSegmentProvider(episode, bitrate,
+                                                  retry_policy=retry_policy,
+                                                  circuit_breaker=circuit_breaker)
+        seg_handler = dl.FilesystemSegmentHandler(episode, bitrate,
+                                                  self._tmpdir.name)
+        dl.Downloader(seg_provider, seg_handler, num_workers=num_workers,
+                      on_segment_metrics=on_segment_metrics).download()
+
+        with open(seg_handler.output_path, 'rb') as f:
+            assert f.read() == server.episode_data(bitrate)
+
+    def test_download(self):
+        with hls_server.HlsServer(num_segments=8) as server:
+            self._download(server, num_workers=4)
+
+    def test_resume_truncated_segments(self):
+        with hls_server.HlsServer(num_segments=8, truncate_rate=.3) as server:
+            self._download(server)
+
+    def test_retry_server_errors(self):
+        with hls_server.HlsServer(num_segments=8, error_rate=.3,
+                                  retry_after=0) as server:
+            self._download(server, num_workers=2)
+
+    def test_circuit_breaker(self):
+        circuit_breaker = retry.CircuitBreaker(failure_threshold=2,
+                                               reset_timeout=60)
+
+        with hls_server.HlsServer(num_segments=2, error_rate=1) as server:
+            with self.assertRaises(dl.DownloadError):
+                self._download(server, circuit_breaker=circuit_breaker)
+
+            # The third try did not reach the server.
+            path = '/{}/segment-0.ts'.format(server.bitrates[-1])
+            assert server.request_count(path) == 2
+
+    def _assert_cancelled_quickly(self, downloader):
+        timer = threading.Timer(.3, downloader.cancel)
+        timer.start()
+        begin = time.monotonic()
+
+        with self.assertRaises(dl.CancelledByUserError):
+            downloader.download()
+
+        timer.join()
+        assert time.monotonic() - begin < 2
+
+    def test_cancel_initialize(self):
+        with hls_server.HlsServer(latency=5) as server:
+            bitrate = server.bitrates[0]
+            episode = server.make_episode()
+            seg_provider = dl.ToutvApiSegmentProvider(episode, bitrate)
+            seg_handler = dl.FilesystemSegmentHandler(episode, bitrate,
+                                                      self._tmpdir.name)
+            downloader = dl.Downloader(seg_provider, seg_handler)
+            self._assert_cancelled_quickly(downloader)
+
+    def test_cancel_transfer(self):
+        with hls_server.HlsServer(bandwidth=100 * 1024) as server:
+            bitrate = server.bitrates[0]
+            episode = server.make_episode()
+            seg_provider = dl.ToutvApiSegmentProvider(episode, bitrate)
+            seg_handler = dl.FilesystemSegmentHandler(episode, bitrate,
+                                                      self._tmpdir.name)
+            downloader = dl.Downloader(seg_provider, seg_handler,
+                                       num_workers=2)
+            self._assert_cancelled_quickly(downloader)
+
+        # What was received so far is kept.
+        seg_handler = dl.FilesystemSegmentHandler(episode, bitrate,
+                                                  self._tmpdir.name)
+        seg_handler.initialize()
+        assert seg_handler.partial_segment(0)
+
+    def test_live(self):
+        num_segments_updates = []
+
+        with hls_server.HlsServer(num_segments=5, segment_duration=.2,
+                                  live=True, window=2) as server:
+            bitrate = server.bitrates[0]
+            episode = server.make_episode()
+            seg_provider = dl.ToutvApiSegmentProvider(episode, bitrate,
+                                                      reload_interval=.05)
+            seg_handler = dl.FilesystemSegmentHandler(episode, bitrate,
+                                                      self._tmpdir.name)
+            dl.Downloader(seg_provider, seg_handler,
+                          on_num_segments_update=num_segments_updates.append).download()
+
+        # The playlist grew while it was downloaded.
+        assert num_segments_updates == sorted(set(num_segments_updates))
+        assert num_segments_updates[-1] == 5
+
+        with open(seg_handler.output_path, 'rb') as f:
+            assert f.read() == server.episode_data(bitrate)
+
+    def test_segment_metrics(self):
+        recorded = []
+
+        with hls_server.HlsServer(num_segments=4) as server:
+            self._download(server, num_workers=2,
+                           on_segment_metrics=recorded.append)
+
+        assert [m.segindex for m in recorded] == [0, 1, 2, 3]
+
+        for m in recorded:
+            assert m.num_bytes == server.segment_size
+            assert 0 <= m.first_byte <= m.last_byte
+            assert m.decrypt_time > 0
+            assert m.write_time >= 0
+            assert m.retries == 0
+
+
+class SegmentDecryptorTest(unittest.TestCase):
+
+    def test_decrypt_unaligned_chunks(self):
+        key = os.urandom(16)
+        iv = os.urandom(16)
+        plaintext = os.urandom(16 * 100)
+        ciphertext = AES.new(key, AES.MODE_CBC, iv).encrypt(plaintext)
+
+        decryptor = dl._SegmentDecryptor(key, iv)
+        decrypted = bytearray()
+
+        for begin in range(0, len(ciphertext), 7):
+            decrypted += decryptor.decrypt(ciphertext[begin:begin + 7])
+
+        decryptor.finalize()
+        assert decrypted == plaintext
+
+    def test_truncated_segment(self):
+        decryptor = dl._SegmentDecryptor(os.urandom(16), os.urandom(16))
+        decryptor.decrypt(os.urandom(20))
+
+        with self.assertRaises(dl.DownloadError):
+            decryptor.finalize()
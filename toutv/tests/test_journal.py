@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from toutv.journal import DownloadJournal, JournalRecord, find_journals
+
+
+class DownloadJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._tmpdir.name, '.test.journal')
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _record(self, index, done=True):
+        return JournalRecord(index=index, size=10 + index, crc32=index,
+                             offset=None, done=done)
+
+    def test_append_load(self):
+        journal = DownloadJournal(self._path)
+        journal.create({'output': 'out.ts'})
+        journal.append(self._record(0, done=False))
+        journal.append(self._record(0))
+        journal.append(self._record(1, done=False))
+
+        journal = DownloadJournal(self._path)
+        assert journal.load()
+        assert journal.header['output'] == 'out.ts'
+        assert journal.records == {
+            0: self._record(0),
+            1: self._record(1, done=False),
+        }
+        assert journal.has_done(0)
+        assert not journal.has_done(1)
+        assert not journal.has_done(2)
+
+    def test_torn_record(self):
+        journal = DownloadJournal(self._path)
+        journal.create({}, [self._record(0)])
+        journal.append(self._record(1))
+
+        with open(self._path, 'ab') as f:
+            f.write(b'{"crc32": 2, "do')
+
+        journal = DownloadJournal(self._path)
+        assert journal.load()
+        assert sorted(journal.records) == [0, 1]
+
+    def test_not_a_journal(self):
+        journal = DownloadJournal(self._path)
+        assert not journal.load()
+
+        with open(self._path, 'w') as f:
+            f.write('0 0 4\n')
+
+        assert not journal.load()
+
+    def test_find_journals(self):
+        journal = DownloadJournal(self._path)
+        journal.create({'temp_globs': ['.test-*']})
+        temp_path = os.path.join(self._tmpdir.name, '.test-0.ts')
+
+        with open(temp_path, 'wb'):
+            pass
+
+        journals = find_journals(self._tmpdir.name)
+        assert [j.path for j in journals] == [self._path]
+        assert journals[0].temp_paths() == [temp_path]
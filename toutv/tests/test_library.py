@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from toutv.library import Library
+
+
+class LibraryTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._tmpdir.name, 'library.json')
+        self._output = os.path.join(self._tmpdir.name, 'episode.ts')
+
+        with open(self._output, 'wb') as f:
+            f.write(b'x' * 100)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_find(self):
+        lib = Library(self._path)
+        self.assertIsNone(lib.find(1, 2, 1000))
+        lib.add(1, 2, 1000, 'pid', None, self._output)
+        lib.add(1, 3, 2000, 'pid3', 'AVERAGE', self._output)
+
+        # Reloaded from the file
+        lib = Library(self._path)
+        entry = lib.find(1, 2, 1000, pid='pid')
+        self.assertEqual(entry.path, self._output)
+        self.assertEqual(entry.size, 100)
+        self.assertIsNotNone(lib.find('1', '2', 1000))
+        self.assertIsNone(lib.find(1, 2, 2000))
+        self.assertIsNone(lib.find(1, 2, 1000, pid='other'))
+        self.assertIsNone(lib.find(1, 2, None, 'AVERAGE'))
+        self.assertIsNotNone(lib.find(1, 3, None, 'AVERAGE'))
+        self.assertIsNotNone(lib.find(1, 3, 2000))
+        self.assertIsNone(lib.find(1, 3, None, 'MAX'))
+
+    def test_missing_file(self):
+        lib = Library(self._path)
+        lib.add(1, 2, 1000, 'pid', None, self._output)
+
+        with open(self._output, 'ab') as f:
+            f.write(b'y')
+
+        self.assertIsNone(lib.find(1, 2, 1000))
+        os.remove(self._output)
+        self.assertIsNone(lib.find(1, 2, 1000))
+
+    def test_torn_line(self):
+        lib = Library(self._path)
+        lib.add(1, 2, 1000, 'pid', None, self._output)
+
+        with open(self._path, 'a') as f:
+            f.write('{"bitrate": 2000, "emission_id"')
+
+        lib = Library(self._path)
+        self.assertIsNotNone(lib.find(1, 2, 1000))
+        self.assertIsNone(lib.find(1, 2, 2000))
@@ -0,0 +1,62 @@
+import os
+import json
+import tempfile
+import unittest
+
+from toutv import metrics
+
+
+def _make_metrics(segindex):
+    m = metrics.SegmentMetrics(segindex)
+    m.num_bytes = 1000
+    m.request_start = 1400000000.
+    m.first_byte = .25
+    m.last_byte = 1.
+    m.decrypt_time = .01
+    m.write_time = .02
+    m.retries = 1
+
+    return m
+
+
+class MetricsWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._tmpdir.name, 'metrics')
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_json_lines(self):
+        writer = metrics.open_writer(self._path, 'jsonl')
+        writer.record(_make_metrics(0), download='a.ts')
+        writer.record(_make_metrics(1), download='a.ts')
+        writer.close()
+
+        with open(self._path) as f:
+            lines = [json.loads(line) for line in f]
+
+        assert [line['segment'] for line in lines] == [0, 1]
+        assert lines[0]['download'] == 'a.ts'
+        assert lines[0]['first_byte'] == .25
+        assert lines[0]['retries'] == 1
+
+    def test_prometheus(self):
+        writer = metrics.open_writer(self._path, 'prometheus')
+        writer.record(_make_metrics(0), download='a"b.ts')
+        writer.record(_make_metrics(1), download='a"b.ts')
+        writer.close()
+
+        with open(self._path) as f:
+            text = f.read()
+
+        assert '# TYPE toutv_segments_total counter\n' in text
+        assert 'toutv_segments_total{download="a\\"b.ts"} 2\n' in text
+        assert 'toutv_segment_bytes_total{download="a\\"b.ts"} 2000\n' in text
+        assert 'toutv_segment_transfer_seconds_sum{download="a\\"b.ts"} 1.5\n' in text
+        assert 'toutv_segment_transfer_seconds_count{download="a\\"b.ts"} 2\n' in text
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            metrics.open_writer(self._path, 'xml')
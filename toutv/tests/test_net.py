@@ -0,0 +1,112 @@
+import http.server
+import socketserver
+import threading
+import time
+import unittest
+from toutv import net
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(5)
+
+        body = b'hello'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'name=value')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.num_connections = 0
+
+    def process_request(self, request, client_address):
+        self.num_connections += 1
+        super().process_request(request, client_address)
+
+
+class HttpSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self._server = _Server()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.start()
+        self._url = 'http://127.0.0.1:{}/'.format(self._server.server_port)
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def test_connection_reuse(self):
+        session = net.HttpSession(pool_size=2)
+
+        for i in range(10):
+            r = session.get(self._url)
+            assert r.content == b'hello'
+
+        session.close()
+        assert self._server.num_connections == 1
+
+    def test_cookies_not_kept(self):
+        session = net.HttpSession()
+        r = session.get(self._url)
+        session.close()
+
+        assert r.cookies['name'] == 'value'
+        assert len(session._session.cookies) == 0
+
+
+class CancelScopeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._server = _Server()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.start()
+        self._url = 'http://127.0.0.1:{}/'.format(self._server.server_port)
+        self._session = net.HttpSession()
+
+    def tearDown(self):
+        self._session.close()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def test_interrupt(self):
+        scope = net.CancelScope()
+        timer = threading.Timer(.2, scope.cancel)
+        timer.start()
+        begin = time.monotonic()
+
+        with self.assertRaises(Exception):
+            with scope:
+                self._session.get(self._url + 'slow')
+
+        timer.join()
+        assert time.monotonic() - begin < 2
+
+        # The other requests of the session are not affected.
+        assert self._session.get(self._url).content == b'hello'
+
+    def test_cancelled(self):
+        scope = net.CancelScope()
+        scope.cancel()
+
+        with self.assertRaises(net.CancelledError):
+            with scope:
+                self._session.get(self._url)
+
+        assert net.get_cancel_scope() is None
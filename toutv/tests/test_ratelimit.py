@@ -0,0 +1,62 @@
+import time
+import threading
+import unittest
+
+from toutv.ratelimit import RateLimiter, parse_rate
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_burst(self):
+        limiter = RateLimiter(1000, burst=50000)
+        start = time.monotonic()
+
+        for i in range(10):
+            assert limiter.consume(5000)
+
+        assert time.monotonic() - start < .5
+
+    def test_rate(self):
+        limiter = RateLimiter(100000, burst=10000)
+        start = time.monotonic()
+
+        # 10 kB of burst, then 40 kB at 100 kB/s.
+        for i in range(10):
+            assert limiter.consume(5000)
+
+        elapsed = time.monotonic() - start
+        assert elapsed >= .35
+        assert elapsed < 2
+
+    def test_set_rate(self):
+        limiter = RateLimiter(10, burst=10)
+        limiter.consume(10)
+        done = threading.Event()
+
+        def consume():
+            limiter.consume(1000)
+            done.set()
+
+        t = threading.Thread(target=consume)
+        t.start()
+        assert not done.wait(.2)
+
+        # Removing the limit releases the waiting thread.
+        limiter.set_rate(None)
+        assert done.wait(2)
+        t.join()
+
+    def test_should_stop(self):
+        limiter = RateLimiter(10, burst=10)
+        limiter.consume(10)
+        assert not limiter.consume(1000, lambda: True)
+
+
+class ParseRateTest(unittest.TestCase):
+    def test_parse_rate(self):
+        assert parse_rate('1234') == 1234
+        assert parse_rate('500k') == 500 * 1024
+        assert parse_rate('2M') == 2 * 1024 * 1024
+        assert parse_rate('1.5m') == 1572864
+
+        with self.assertRaises(ValueError):
+            parse_rate('fast')
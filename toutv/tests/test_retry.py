@@ -0,0 +1,97 @@
+import unittest
+
+from toutv import exceptions
+from toutv.retry import CircuitBreaker, RetryPolicy, parse_retry_after
+
+
+class _FakeClock:
+
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_should_retry(self):
+        policy = RetryPolicy(max_tries=3)
+        error = exceptions.UnexpectedHttpStatusCodeError('url', 503)
+        assert policy.should_retry(1, error)
+        assert policy.should_retry(2, exceptions.NetworkError())
+        assert not policy.should_retry(3, error)
+        assert policy.should_retry(1, exceptions.UnexpectedHttpStatusCodeError('url', 429))
+        assert not policy.should_retry(1, exceptions.UnexpectedHttpStatusCodeError('url', 404))
+        assert not policy.should_retry(1, ValueError())
+
+    def test_delay(self):
+        policy = RetryPolicy(base_delay=1, max_delay=5, jitter=.5)
+
+        for i in range(100):
+            assert .5 <= policy.get_delay(1) <= 1
+            assert 2 <= policy.get_delay(3) <= 4
+            assert 2.5 <= policy.get_delay(10) <= 5
+
+        policy = RetryPolicy(base_delay=1, jitter=0)
+        assert policy.get_delay(2) == 2
+
+    def test_retry_after(self):
+        policy = RetryPolicy(max_retry_after=60)
+        error = exceptions.UnexpectedHttpStatusCodeError('url', 503, 42)
+        assert policy.get_delay(1, error) == 42
+        error = exceptions.UnexpectedHttpStatusCodeError('url', 503, 3600)
+        assert policy.get_delay(1, error) == 60
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after('120') == 120
+        assert parse_retry_after(None) is None
+        assert parse_retry_after('soon') is None
+        now = 784111777 - 30
+        assert parse_retry_after('Sun, 06 Nov 1994 08:49:37 GMT', now) == 30
+        assert parse_retry_after('Sun, 06 Nov 1994 08:49:37 GMT') == 0
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_open_close(self):
+        clock = _FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10,
+                                 clock=clock)
+        breaker.on_failure('a')
+        breaker.check('a')
+        breaker.on_success('a')
+        breaker.on_failure('a')
+        breaker.check('a')
+        breaker.on_failure('a')
+        assert breaker.is_open('a')
+
+        with self.assertRaises(exceptions.CircuitOpenError) as cm:
+            breaker.check('a')
+
+        assert cm.exception.retry_after == 10
+
+        # Other hosts are not affected.
+        breaker.check('b')
+
+        # A single trial request once the timeout expired...
+        clock.now = 10
+        breaker.check('a')
+
+        with self.assertRaises(exceptions.CircuitOpenError):
+            breaker.check('a')
+
+        # ... which reopens the circuit if it fails...
+        breaker.on_failure('a')
+        clock.now = 15
+
+        with self.assertRaises(exceptions.CircuitOpenError):
+            breaker.check('a')
+
+        # ... and closes it if it succeeds.
+        clock.now = 20
+        breaker.check('a')
+        breaker.on_success('a')
+        assert not breaker.is_open('a')
+        breaker.check('a')
+        breaker.check('a')
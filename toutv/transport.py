@@ -29,6 +29,7 @@ import requests
 import toutv.exceptions
 import toutv.mapper
 import toutv.config
+import toutv.net
 import toutv.bos as bos
 
 
@@ -65,8 +66,10 @@ class JsonTransport(Transport):
         try:
             headers = toutv.config.HEADERS
 
-            r = requests.get(url, params=params, headers=headers,
-                             proxies=self._proxies, timeout=timeout)
+            r = toutv.net.get_session().get(url, params=params,
+                                            headers=headers,
+                                            proxies=self._proxies,
+                                            timeout=timeout)
             if r.status_code != 200:
                 code = r.status_code
                 raise toutv.exceptions.UnexpectedHttpStatusCodeError(url, code)
@@ -36,6 +36,9 @@ import sys
 import time
 import logging
 import textwrap
+import threading
+import functools
+import concurrent.futures
 import platform
 import getpass
 import toutv.dl
@@ -44,7 +47,13 @@ import toutv.cache
 import toutv.config
 import toutv.auth
 import toutv.exceptions
+import toutv.journal
+import toutv.library
+import toutv.metrics
+import toutv.net
+import toutv.ratelimit
 from toutvcli import __version__
+from toutvcli import daemon
 from toutvcli.progressbar import ProgressBar
 import traceback
 from urllib.parse import urlparse
@@ -65,10 +74,15 @@ class App:
     def __init__(self, args):
         self._argparser = self._build_argparser()
         self._args = args
-        self._dl = None
+        self._downloaders = set()
+        # Reentrant: the SIGINT handler cancels the downloaders from the
+        # main thread, possibly while it holds the lock.
+        self._downloaders_lock = threading.RLock()
         self._stop = False
         self._logger = logging.getLogger(__name__)
         self._toutv_client = None
+        self._client_lock = threading.Lock()
+        self._library = None
         self._verbose = False
 
     def run(self):
@@ -138,6 +152,9 @@ class App:
         except CliError as e:
             print('Command line error: {}'.format(e), file=sys.stderr)
             return 1
+        except daemon.DaemonError as e:
+            print('Daemon error: {}'.format(e), file=sys.stderr)
+            return 1
         except toutv.client.NoMatchException as e:
             self._handle_no_match_exception(e)
             return 1
@@ -266,9 +283,98 @@ command. The episode can be specified using its name, number or id.
         pf.add_argument('-q', '--quality', action='store',
                         default=App.QUALITY_AVG, choices=quality_choices,
                         help='Video quality (default: {})'.format(App.QUALITY_AVG))
+        pf.add_argument('-s', '--single-file', action='store_true',
+                        help='Write segments directly to the output file instead of using temporary segment files')
+        pf.add_argument('-w', '--segment-workers', action='store', type=int,
+                        default=1,
+                        help='Number of segments to fetch concurrently (default: 1)')
+        pf.add_argument('-j', '--jobs', action='store', type=int,
+                        default=1,
+                        help='Number of episodes to fetch concurrently when fetching a whole show (default: 1)')
+        pf.add_argument('-l', '--limit-rate', action='store',
+                        type=toutv.ratelimit.parse_rate,
+                        help='Maximum total download rate in bytes per second, with an optional k or M suffix, e.g. 500k or 2M (default: unlimited)')
+        pf.add_argument('--metrics', action='store', metavar='FILE',
+                        help='Write per-segment download metrics to FILE')
+        pf.add_argument('--metrics-format', action='store', default='jsonl',
+                        choices=sorted(toutv.metrics.WRITERS),
+                        help='Format of the metrics file: one JSON line per segment, or Prometheus text (default: jsonl)')
         pf.set_defaults(func=self._command_fetch)
         pf.set_defaults(build_client=True)
 
+        # daemon command
+        desc = '''
+Run a download daemon. The daemon keeps a queue of jobs, submitted with the
+submit command, across restarts, and serves a control API on
+127.0.0.1:<port>.
+'''
+        pd = sp.add_parser('daemon', help='Run a download daemon',
+                           description=desc)
+        pd.add_argument('-p', '--port', action='store', type=int,
+                        default=daemon.DEFAULT_PORT,
+                        help='Port of the control API (default: {})'.format(daemon.DEFAULT_PORT))
+        pd.add_argument('-j', '--jobs', action='store', type=int, default=1,
+                        help='Number of jobs to run concurrently (default: 1)')
+        pd.add_argument('-w', '--segment-workers', action='store', type=int,
+                        default=1,
+                        help='Number of segments to fetch concurrently per job (default: 1)')
+        pd.add_argument('-l', '--limit-rate', action='store',
+                        type=toutv.ratelimit.parse_rate,
+                        help='Maximum total download rate in bytes per second, with an optional k or M suffix (default: unlimited)')
+        pd.set_defaults(func=self._command_daemon)
+        pd.set_defaults(build_client=True)
+
+        # submit command
+        usage = ('\n\n'
+                 '    1. toutv submit [options] <episode-url>\n'
+                 '    2. toutv submit [options] <show-url>\n'
+                 '    3. toutv submit [options] <show> <episode>\n'
+                 '    4. toutv submit [options] <show>\n')
+        psu = sp.add_parser('submit',
+                            help='Queue a fetch job in the download daemon',
+                            usage=usage,
+                            description='Same as fetch, but done by the download daemon.')
+        psu.add_argument(App.FETCH_INFO_FIRST_ARG, action='store', type=str,
+                         help='Show or URL, depending on the form used.')
+        psu.add_argument(App.FETCH_INFO_SECOND_ARG, action='store', type=str, nargs='?',
+                         help='Episode, if necessary.')
+        psu.add_argument('-b', '--bitrate', action='store', type=int,
+                         help='Video bitrate (default: use default quality)')
+        psu.add_argument('-d', '--directory', action='store',
+                         default=os.getcwd(),
+                         help='Output directory (default: CWD)')
+        psu.add_argument('-f', '--force', action='store_true',
+                         help='Overwrite existing output file')
+        psu.add_argument('-q', '--quality', action='store',
+                         default=App.QUALITY_AVG, choices=quality_choices,
+                         help='Video quality (default: {})'.format(App.QUALITY_AVG))
+        psu.add_argument('-s', '--single-file', action='store_true',
+                         help='Write segments directly to the output file instead of using temporary segment files')
+        psu.add_argument('-p', '--port', action='store', type=int,
+                         default=daemon.DEFAULT_PORT,
+                         help='Port of the daemon (default: {})'.format(daemon.DEFAULT_PORT))
+        psu.set_defaults(func=self._command_submit)
+        psu.set_defaults(build_client=False)
+
+        # jobs command
+        pj = sp.add_parser('jobs', help='List the jobs of the download daemon')
+        pj.add_argument('id', action='store', type=int, nargs='?',
+                        help='Only show this job')
+        pj.add_argument('-p', '--port', action='store', type=int,
+                        default=daemon.DEFAULT_PORT,
+                        help='Port of the daemon (default: {})'.format(daemon.DEFAULT_PORT))
+        pj.set_defaults(func=self._command_jobs)
+        pj.set_defaults(build_client=False)
+
+        # cancel command
+        pca = sp.add_parser('cancel', help='Cancel a job of the download daemon')
+        pca.add_argument('id', action='store', type=int, help='Job to cancel')
+        pca.add_argument('-p', '--port', action='store', type=int,
+                         default=daemon.DEFAULT_PORT,
+                         help='Port of the daemon (default: {})'.format(daemon.DEFAULT_PORT))
+        pca.set_defaults(func=self._command_cancel)
+        pca.set_defaults(build_client=False)
+
         # clean command
         pc = sp.add_parser('clean', help='Clean temporary downloaded files')
         pc.add_argument('directory', action='store', nargs='?',
@@ -307,6 +413,10 @@ command. The episode can be specified using its name, number or id.
 
         return cache_path
 
+    @staticmethod
+    def _build_library():
+        return toutv.library.Library(App._build_cache_path('toutv_library.json'))
+
     @staticmethod
     def _build_cache():
         return toutv.cache.ShelveCache(App._build_cache_path('.toutv_cache'))
@@ -419,10 +529,28 @@ command. The episode can be specified using its name, number or id.
 
         import glob
 
+        # Downloads with a journal know exactly which files are theirs.
+        for journal in toutv.journal.find_journals(args.directory):
+            output = journal.header.get('output')
+            temp_paths = journal.temp_paths()
+            num_done = sum(1 for r in journal.records.values() if r.done)
+
+            tmpl = 'Removing incomplete download "{}" ({} complete segments, {} files)'
+            print(tmpl.format(output, num_done, len(temp_paths) + 1))
+            self._remove_files(temp_paths + [journal.path])
+
+        # Leftovers of downloads without a journal.
         tmpdl = glob.glob(os.path.join(args.directory, '.toutv-*.*'))
         tmpcomplete = glob.glob(os.path.join(args.directory, '*.ts.part'))
+        tmpjournals = glob.glob(os.path.join(args.directory, '*.ts.part.journal'))
+
+        self._remove_files(tmpdl + tmpcomplete + tmpjournals)
+
+    def _remove_files(self, paths):
+        for f in paths:
+            if not os.path.exists(f):
+                continue
 
-        for f in tmpdl + tmpcomplete:
             try:
                 self._logger.debug('removing file "{}"'.format(f))
                 os.remove(f)
@@ -479,17 +607,225 @@ command. The episode can be specified using its name, number or id.
         bitrate = args.bitrate
         quality = args.quality
         overwrite = args.force
+        num_workers = args.segment_workers
+        single_file = args.single_file
+        jobs = args.jobs
+
+        if num_workers < 1:
+            raise CliError('Number of segment workers must be at least 1')
+
+        if jobs < 1:
+            raise CliError('Number of jobs must be at least 1')
+
+        # All the episodes fetched concurrently share a single budget of
+        # in-flight segment requests.
+        budget = max(jobs, num_workers)
+        limiter = toutv.dl.ConcurrencyLimiter(budget)
+
+        # ... and a single bandwidth budget.
+        rate_limiter = toutv.ratelimit.RateLimiter(args.limit_rate)
+
+        # Make sure there are enough pooled connections for all the workers.
+        if budget > toutv.net.get_session().pool_size:
+            toutv.net.configure(pool_size=budget)
 
         first = getattr(args, App.FETCH_INFO_FIRST_ARG)
         second = getattr(args, App.FETCH_INFO_SECOND_ARG)
 
         show, episode = self._get_show_episode_from_args(first, second)
+        self._library = App._build_library()
 
-        if episode:
-            self._fetch_episode(episode, output_dir=output_dir, quality=quality, bitrate=bitrate, overwrite=overwrite)
+        metrics_writer = None
+
+        if args.metrics:
+            try:
+                metrics_writer = toutv.metrics.open_writer(args.metrics, args.metrics_format)
+            except OSError as e:
+                raise CliError('Cannot open metrics file "{}": {}'.format(args.metrics, e))
+
+        try:
+            if episode:
+                self._fetch_episode(episode, output_dir=output_dir, quality=quality, bitrate=bitrate,
+                                    overwrite=overwrite, num_workers=num_workers, single_file=single_file,
+                                    limiter=limiter, rate_limiter=rate_limiter, metrics_writer=metrics_writer)
+            else:
+                self._fetch_emission_episodes(show, output_dir=output_dir, quality=quality, bitrate=bitrate,
+                                              overwrite=overwrite, num_workers=num_workers, single_file=single_file,
+                                              jobs=jobs, limiter=limiter, rate_limiter=rate_limiter,
+                                              metrics_writer=metrics_writer)
+        finally:
+            if metrics_writer is not None:
+                metrics_writer.close()
+
+    def _command_daemon(self, args):
+        num_jobs = args.jobs
+        num_workers = args.segment_workers
+
+        if num_workers < 1:
+            raise CliError('Number of segment workers must be at least 1')
+
+        if num_jobs < 1:
+            raise CliError('Number of jobs must be at least 1')
+
+        # Same global budgets as the fetch command.
+        budget = max(num_jobs, num_workers)
+        limiter = toutv.dl.ConcurrencyLimiter(budget)
+        rate_limiter = toutv.ratelimit.RateLimiter(args.limit_rate)
+
+        if budget > toutv.net.get_session().pool_size:
+            toutv.net.configure(pool_size=budget)
+
+        self._library = App._build_library()
+        queue = daemon.JobQueue(App._build_cache_path('toutv_daemon_queue.json'))
+        run_job = functools.partial(self._run_daemon_job,
+                                    num_workers=num_workers, limiter=limiter,
+                                    rate_limiter=rate_limiter)
+
+        try:
+            dmn = daemon.Daemon(queue, run_job, App._validate_job_params,
+                                num_jobs=num_jobs, port=args.port)
+        except OSError as e:
+            raise CliError('Cannot listen on port {}: {}'.format(args.port, e))
+
+        print('Listening on 127.0.0.1:{}'.format(dmn.port))
+        sys.stdout.flush()
+        dmn.start()
+
+        try:
+            dmn.serve_forever()
+        finally:
+            dmn.shutdown()
+
+    @staticmethod
+    def _validate_job_params(params):
+        # Return an error message if the parameters of a job are invalid.
+        if not isinstance(params, dict):
+            return 'job parameters must be an object'
+
+        if not isinstance(params.get('show'), str):
+            return 'missing show'
+
+        if params.get('episode') is not None and not isinstance(params['episode'], str):
+            return 'invalid episode'
+
+        if not isinstance(params.get('output_dir'), str):
+            return 'missing output directory'
+
+        if params.get('quality') not in [App.QUALITY_MIN, App.QUALITY_AVG, App.QUALITY_MAX]:
+            return 'invalid quality'
+
+        if params.get('bitrate') is not None and not isinstance(params['bitrate'], int):
+            return 'invalid bitrate'
+
+        return None
+
+    def _run_daemon_job(self, job, num_workers, limiter, rate_limiter):
+        params = job.params
+
+        # The client (and its cache) is shared by all the jobs.
+        with self._client_lock:
+            show, episode = self._get_show_episode_from_args(params['show'], params.get('episode'))
+
+            if episode:
+                episodes = [episode]
+            else:
+                episodes = App._sort_episodes(self._toutv_client.get_emission_episodes(show, True))
+
+        errors = []
+
+        for episode in episodes:
+            if job.cancelled:
+                raise toutv.dl.CancelledByUserError()
+
+            title = episode.get_title()
+
+            if self._skip_fetched(episode, params.get('bitrate'), params['quality'],
+                                  params.get('overwrite', False)):
+                continue
+
+            try:
+                if episode.PID is None:
+                    with self._client_lock:
+                        episode = self._toutv_client.get_episode_by_name(show, str(episode.Id))
+
+                self._fetch_episode(episode, params['output_dir'], params.get('bitrate'), params['quality'],
+                                    params.get('overwrite', False), num_workers, params.get('single_file', False),
+                                    limiter, rate_limiter, show_progress=False,
+                                    on_downloader=functools.partial(job.set_downloader, title))
+            except toutv.dl.CancelledByUserError:
+                raise
+            except Exception as e:
+                # Only fail the job of a whole show at the end.
+                if len(episodes) == 1:
+                    raise
+
+                errors.append('"{}": {}'.format(title, e))
+
+        if errors:
+            tmpl = 'cannot fetch {} episodes: {}'
+            raise toutv.dl.DownloadError(tmpl.format(len(errors), '; '.join(errors)))
+
+    def _command_submit(self, args):
+        first = getattr(args, App.FETCH_INFO_FIRST_ARG)
+        second = getattr(args, App.FETCH_INFO_SECOND_ARG)
+
+        # Only parse: the daemon finds the show and episode.
+        show_spec, episode_spec = self._parse_show_episode_from_args(first, second)
+        params = {
+            'show': show_spec,
+            'episode': episode_spec,
+            'output_dir': os.path.abspath(args.directory),
+            'quality': args.quality,
+            'bitrate': args.bitrate,
+            'overwrite': args.force,
+            'single_file': args.single_file,
+        }
+        job = daemon.DaemonClient(port=args.port).submit(params)
+        print('Queued job {}'.format(job['id']))
+
+    @staticmethod
+    def _format_job(job):
+        params = job['params']
+        what = params['show']
+
+        if params['episode'] is None:
+            what += ' (all episodes)'
+        else:
+            what += ' ' + params['episode']
+
+        line = '{:>5}  {:<10} {}'.format(job['id'], job['state'], what)
+
+        if job['error']:
+            line += ': {}'.format(job['error'])
+
+        progress = job.get('progress')
+
+        if progress and progress['num_segments']:
+            tmpl = '\n       "{}": {}/{} segments, {:.1f} MiB'
+            line += tmpl.format(progress['episode'], progress['done_segments'],
+                                progress['num_segments'],
+                                progress['done_bytes'] / (1 << 20))
+
+        return line
+
+    def _command_jobs(self, args):
+        client = daemon.DaemonClient(port=args.port)
+
+        if args.id is not None:
+            jobs = [client.job(args.id)]
         else:
-            self._fetch_emission_episodes(show, output_dir=output_dir, quality=quality, bitrate=bitrate,
-                                          overwrite=overwrite)
+            jobs = client.jobs()
+
+        if not jobs:
+            print('No jobs')
+            return
+
+        for job in jobs:
+            print(App._format_job(job))
+
+    def _command_cancel(self, args):
+        job = daemon.DaemonClient(port=args.port).cancel(args.id)
+        print('Cancelling job {} ({})'.format(job['id'], job['state']))
 
     def _command_search(self, args):
         self._print_search_results(args.query)
@@ -680,12 +1016,17 @@ command. The episode can be specified using its name, number or id.
         sys.stdout.write('\r{}'.format(bar))
         sys.stdout.flush()
 
-    def _on_dl_start(self, total_segments):
+    def _on_dl_start(self, filename, total_segments):
         self._cur_segments_count = total_segments
-        self._cur_pb = ProgressBar(self._seg_handler.filename, total_segments)
+        self._cur_pb = ProgressBar(filename, total_segments)
         self._last_pb_time = time.time()
         self._print_cur_pb(0, 0, True)
 
+    def _on_dl_num_segments_update(self, total_segments):
+        # Live playlists grow while they are downloaded.
+        self._cur_segments_count = total_segments
+        self._cur_pb.set_segments_count(total_segments)
+
     def _on_dl_progress_update(self, num_completed_segments,
                                num_bytes_completed_segments,
                                num_bytes_partial_segment):
@@ -695,10 +1036,42 @@ command. The episode can be specified using its name, number or id.
         total_bytes = num_bytes_completed_segments + num_bytes_partial_segment
         self._print_cur_pb(num_completed_segments, total_bytes, False)
 
-    def _fetch_episode(self, episode, output_dir, bitrate, quality, overwrite):
+    def _on_dl_start_quiet(self, filename, total_segments):
+        # Progress bars of concurrent downloads would overwrite each
+        # other: only say what is being downloaded.
+        print('Fetching {} ({} segments)'.format(filename, total_segments))
+
+    def _add_downloader(self, downloader):
+        with self._downloaders_lock:
+            if self._stop:
+                raise toutv.dl.CancelledByUserError()
+
+            self._downloaders.add(downloader)
+
+    def _remove_downloader(self, downloader):
+        with self._downloaders_lock:
+            self._downloaders.discard(downloader)
+
+    def _cancel_downloaders(self):
+        with self._downloaders_lock:
+            self._stop = True
+
+            for downloader in list(self._downloaders):
+                downloader.cancel()
+
+    def _fetch_episode(self, episode, output_dir, bitrate, quality, overwrite,
+                       num_workers=1, single_file=False, limiter=None,
+                       rate_limiter=None, metrics_writer=None,
+                       show_progress=True, on_downloader=None):
+        if self._skip_fetched(episode, bitrate, quality, overwrite):
+            return
+
         # Get available bitrates for episode
         qualities = episode.get_available_qualities()
 
+        # Quality setting which chooses the bitrate, if any
+        library_quality = quality if bitrate is None else None
+
         # Choose bitrate
         if bitrate is None:
             if quality == App.QUALITY_MIN:
@@ -709,28 +1082,85 @@ command. The episode can be specified using its name, number or id.
                 bitrate = App._get_average_bitrate(qualities)
 
         # Create segment handler
-        self._seg_handler = toutv.dl.FilesystemSegmentHandler(
+        if single_file:
+            seg_handler_cls = toutv.dl.SingleFileSegmentHandler
+        else:
+            seg_handler_cls = toutv.dl.FilesystemSegmentHandler
+
+        seg_handler = seg_handler_cls(
             episode=episode, bitrate=bitrate, output_dir=output_dir,
             overwrite=overwrite)
 
         seg_provider = toutv.dl.ToutvApiSegmentProvider(
-            episode=episode, bitrate=bitrate)
+            episode=episode, bitrate=bitrate, rate_limiter=rate_limiter)
 
         # Create downloader
-        self._dl = toutv.dl.Downloader(
+        if show_progress:
+            on_progress_update = self._on_dl_progress_update
+            on_num_segments_update = self._on_dl_num_segments_update
+            on_dl_start = functools.partial(self._on_dl_start,
+                                            seg_handler.filename)
+        else:
+            on_progress_update = None
+            on_num_segments_update = None
+            on_dl_start = functools.partial(self._on_dl_start_quiet,
+                                            seg_handler.filename)
+
+        on_segment_metrics = None
+
+        if metrics_writer is not None:
+            on_segment_metrics = functools.partial(metrics_writer.record,
+                                                   download=seg_handler.filename)
+
+        downloader = toutv.dl.Downloader(
             seg_provider=seg_provider,
-            seg_handler=self._seg_handler,
-            on_progress_update=self._on_dl_progress_update,
-            on_dl_start=self._on_dl_start)
+            seg_handler=seg_handler,
+            on_progress_update=on_progress_update,
+            on_dl_start=on_dl_start,
+            num_workers=num_workers,
+            limiter=limiter,
+            on_segment_metrics=on_segment_metrics,
+            on_num_segments_update=on_num_segments_update)
+
+        if on_downloader is not None:
+            on_downloader(downloader)
 
         # Start download
-        self._dl.download()
+        self._add_downloader(downloader)
+
+        try:
+            downloader.download()
+        finally:
+            self._remove_downloader(downloader)
+
+        if self._library is not None:
+            self._library.add(episode.get_emission_id(), episode.get_id(),
+                              bitrate, episode.PID, library_quality,
+                              seg_handler.output_path)
+
+        if not show_progress:
+            print('Fetched {}'.format(seg_handler.filename))
+
+    def _skip_fetched(self, episode, bitrate, quality, overwrite):
+        # Check in the library, without any network request, if episode
+        # was already fetched with these settings.
+        if self._library is None or overwrite:
+            return False
 
-        # Finished
-        self._dl = None
+        entry = self._library.find(episode.get_emission_id(), episode.get_id(),
+                                   bitrate, quality, episode.PID)
+
+        if entry is None:
+            return False
+
+        print('Already fetched {}'.format(entry.path))
+
+        return True
 
     def _fetch_emission_episodes(self, emission, output_dir, bitrate, quality,
-                                 overwrite):
+                                 overwrite, num_workers=1, single_file=False,
+                                 jobs=1, limiter=None, rate_limiter=None,
+                                 metrics_writer=None):
         episodes = self._toutv_client.get_emission_episodes(emission, True)
 
         if not episodes:
@@ -738,38 +1168,79 @@ command. The episode can be specified using its name, number or id.
             print('No episodes available for emission "{}"'.format(title))
             return
 
-        for episode in App._sort_episodes(episodes):
-            title = episode.get_title()
+        fetch = functools.partial(self._fetch_emission_episode, emission,
+                                  output_dir=output_dir, bitrate=bitrate,
+                                  quality=quality, overwrite=overwrite,
+                                  num_workers=num_workers,
+                                  single_file=single_file, limiter=limiter,
+                                  rate_limiter=rate_limiter,
+                                  metrics_writer=metrics_writer,
+                                  show_progress=(jobs == 1))
+
+        if jobs == 1:
+            for episode in App._sort_episodes(episodes):
+                fetch(episode)
+
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            futures = [executor.submit(fetch, episode)
+                       for episode in App._sort_episodes(episodes)]
 
-            if self._stop:
-                raise toutv.dl.CancelledByUserError()
             try:
-                if episode.PID is None:
-                    episode = self._toutv_client.get_episode_by_name(emission, str(episode.Id))
-                self._fetch_episode(episode, output_dir, bitrate, quality,
-                                    overwrite)
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # Stop the running downloads and the episodes which are not
+                # started yet, so that the executor can shut down quickly.
+                self._cancel_downloaders()
+
+                for future in futures:
+                    future.cancel()
+
+                raise
+
+    def _fetch_emission_episode(self, emission, episode, output_dir, bitrate,
+                                quality, overwrite, num_workers, single_file,
+                                limiter, rate_limiter, metrics_writer,
+                                show_progress):
+        title = episode.get_title()
+
+        if self._stop:
+            raise toutv.dl.CancelledByUserError()
+
+        if self._skip_fetched(episode, bitrate, quality, overwrite):
+            return
+
+        try:
+            if episode.PID is None:
+                episode = self._toutv_client.get_episode_by_name(emission, str(episode.Id))
+            self._fetch_episode(episode, output_dir, bitrate, quality,
+                                overwrite, num_workers, single_file, limiter,
+                                rate_limiter, metrics_writer, show_progress)
+            if show_progress:
                 sys.stdout.write('\n')
                 sys.stdout.flush()
-            except toutv.exceptions.RequestTimeoutError:
-                tmpl = 'Error: cannot fetch "{}": request timeout'
-                print(tmpl.format(title), file=sys.stderr)
-            except toutv.exceptions.UnexpectedHttpStatusCodeError:
-                tmpl = 'Error: cannot fetch "{}": unexpected HTTP status code'
-                print(tmpl.format(title), file=sys.stderr)
-            except toutv.exceptions.NetworkError as e:
-                tmpl = 'Error: cannot fetch "{}": {}'
-                print(tmpl.format(title, e), file=sys.stderr)
-            except toutv.dl.FileExistsError as e:
-                tmpl = 'Error: cannot fetch "{}": destination file {} already exists'
-                print(tmpl.format(title, e.path), file=sys.stderr)
-            except toutv.dl.CancelledByUserError as e:
-                raise e
-            except toutv.dl.DownloadError as e:
-                tmpl = 'Error: cannot fetch "{}": {}'
-                print(tmpl.format(title, e), file=sys.stderr)
-            except Exception as e:
-                tmpl = 'Error: cannot fetch "{}": {}'
-                print(tmpl.format(title, e), file=sys.stderr)
+        except toutv.exceptions.RequestTimeoutError:
+            tmpl = 'Error: cannot fetch "{}": request timeout'
+            print(tmpl.format(title), file=sys.stderr)
+        except toutv.exceptions.UnexpectedHttpStatusCodeError:
+            tmpl = 'Error: cannot fetch "{}": unexpected HTTP status code'
+            print(tmpl.format(title), file=sys.stderr)
+        except toutv.exceptions.NetworkError as e:
+            tmpl = 'Error: cannot fetch "{}": {}'
+            print(tmpl.format(title, e), file=sys.stderr)
+        except toutv.dl.FileExistsError as e:
+            tmpl = 'Error: cannot fetch "{}": destination file {} already exists'
+            print(tmpl.format(title, e.path), file=sys.stderr)
+        except toutv.dl.CancelledByUserError as e:
+            raise e
+        except toutv.dl.DownloadError as e:
+            tmpl = 'Error: cannot fetch "{}": {}'
+            print(tmpl.format(title, e), file=sys.stderr)
+        except Exception as e:
+            tmpl = 'Error: cannot fetch "{}": {}'
+            print(tmpl.format(title, e), file=sys.stderr)
 
     @staticmethod
     def _sort_episodes(episodes):
@@ -779,10 +1250,14 @@ command. The episode can be specified using its name, number or id.
         return sorted(episodes.values(), key=episode_sort_func)
 
 
-def _register_sigint():
+def _register_sigint(app):
     if platform.system() == 'Linux':
         def handler(signal, frame):
             print('Cancelled by user', file=sys.stderr)
+
+            # Interrupt the transfers of all the downloads right away,
+            # whatever thread they run in.
+            app._cancel_downloaders()
             sys.exit(1)
 
         import signal
@@ -791,6 +1266,6 @@ def _register_sigint():
 
 def run():
     app = App(sys.argv[1:])
-    _register_sigint()
+    _register_sigint(app)
 
     return app.run()
@@ -0,0 +1,462 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# Copyright (c) 2014, Philippe Proulx <eepp.ca>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn OR Philippe Proulx
+# BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import json
+import time
+import logging
+import threading
+import http.client
+import http.server
+import socketserver
+
+
+DEFAULT_PORT = 9412
+
+
+class DaemonError(Exception):
+    pass
+
+
+class Job:
+    """A download job of the daemon.
+
+    params holds what to download, as given to the submit command: show,
+    episode (None for all the episodes of the show), output_dir, quality,
+    bitrate, overwrite and single_file.
+
+    While the job runs, the downloader of the current episode is attached
+    to it, so that the job can be cancelled and its progress reported.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, job_id, params, state=QUEUED, error=None,
+                 created=None):
+        self.id = job_id
+        self.params = params
+        self.state = state
+        self.error = error
+        self.created = created if created is not None else time.time()
+
+        # Not persisted.
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._downloader = None
+        self._current = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+
+            if self._downloader is not None:
+                self._downloader.cancel()
+
+    def set_downloader(self, current, downloader):
+        """Attaches the downloader of the episode named current."""
+
+        with self._lock:
+            self._current = current
+            self._downloader = downloader
+
+            if downloader is not None and self._cancelled:
+                downloader.cancel()
+
+    def to_dict(self, with_progress=False):
+        obj = {
+            'id': self.id,
+            'params': self.params,
+            'state': self.state,
+            'error': self.error,
+            'created': self.created,
+        }
+
+        if with_progress:
+            with self._lock:
+                downloader = self._downloader
+
+                if downloader is not None:
+                    obj['progress'] = {
+                        'episode': self._current,
+                        'done_segments': downloader.done_segments,
+                        'num_segments': downloader.num_segments,
+                        'done_bytes': downloader.done_bytes,
+                    }
+
+        return obj
+
+    @staticmethod
+    def from_dict(obj):
+        return Job(obj['id'], obj['params'], obj['state'], obj.get('error'),
+                   obj.get('created'))
+
+
+class JobQueue:
+    """Persistent queue of jobs.
+
+    The jobs are saved to a JSON file each time they change, so that the
+    queue survives restarts; jobs which were running when the daemon
+    stopped are queued again. Instances may be used concurrently by
+    multiple threads.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._cond = threading.Condition()
+        self._jobs = []
+        self._next_id = 1
+        self._closed = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self._path) as f:
+                obj = json.load(f)
+        except FileNotFoundError:
+            return
+
+        for job_obj in obj['jobs']:
+            job = Job.from_dict(job_obj)
+
+            if job.state == Job.RUNNING:
+                job.state = Job.QUEUED
+
+            self._jobs.append(job)
+
+        self._next_id = obj['next_id']
+
+    def _save(self):
+        obj = {
+            'next_id': self._next_id,
+            'jobs': [job.to_dict() for job in self._jobs],
+        }
+        tmp_path = self._path + '.tmp'
+
+        with open(tmp_path, 'w') as f:
+            json.dump(obj, f, indent=2)
+
+        os.replace(tmp_path, self._path)
+
+    def add(self, params):
+        with self._cond:
+            job = Job(self._next_id, params)
+            self._next_id += 1
+            self._jobs.append(job)
+            self._save()
+            self._cond.notify()
+
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            for job in self._jobs:
+                if job.id == job_id:
+                    return job
+
+        return None
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs)
+
+    def take(self):
+        """Waits for a queued job, marks it as running and returns it.
+        Returns None once the queue is closed."""
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+
+                for job in self._jobs:
+                    if job.state == Job.QUEUED:
+                        job.state = Job.RUNNING
+                        self._save()
+
+                        return job
+
+                self._cond.wait()
+
+    def set_state(self, job, state, error=None):
+        with self._cond:
+            job.state = state
+            job.error = error
+            self._save()
+
+    def cancel(self, job_id):
+        """Cancels a job. Returns the job, or None if there is no such
+        job."""
+
+        with self._cond:
+            job = self.get(job_id)
+
+            if job is None:
+                return None
+
+            if job.state == Job.QUEUED:
+                job.state = Job.CANCELLED
+                self._save()
+            elif job.state == Job.RUNNING:
+                # The worker sets the final state.
+                job.cancel()
+
+        return job
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    # GET /jobs: all the jobs
+    # GET /jobs/<id>: one job, with its progress if it is running
+    # POST /jobs: queue a job (JSON body: parameters of the job)
+    # DELETE /jobs/<id>: cancel a job
+
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_not_found(self):
+        self._send_json(404, {'error': 'not found'})
+
+    def _get_job(self):
+        # Returns the job of a /jobs/<id> path, or None.
+        parts = self.path.strip('/').split('/')
+
+        if len(parts) != 2 or parts[0] != 'jobs' or not parts[1].isdigit():
+            return None
+
+        return self.server.queue.get(int(parts[1]))
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/jobs':
+            jobs = [job.to_dict(True) for job in self.server.queue.jobs()]
+            self._send_json(200, {'jobs': jobs})
+            return
+
+        job = self._get_job()
+
+        if job is None:
+            self._send_not_found()
+            return
+
+        self._send_json(200, job.to_dict(True))
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self._send_not_found()
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+
+        try:
+            params = json.loads(self.rfile.read(length).decode())
+        except ValueError:
+            self._send_json(400, {'error': 'invalid JSON body'})
+            return
+
+        error = self.server.validate_params(params)
+
+        if error:
+            self._send_json(400, {'error': error})
+            return
+
+        job = self.server.queue.add(params)
+        logging.getLogger(__name__).info('queued job {}: {}'.format(job.id, params))
+        self._send_json(201, job.to_dict())
+
+    def do_DELETE(self):
+        job = self._get_job()
+
+        if job is None:
+            self._send_not_found()
+            return
+
+        self.server.queue.cancel(job.id)
+        self._send_json(200, job.to_dict())
+
+    def log_message(self, fmt, *args):
+        logging.getLogger(__name__).debug(fmt % args)
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, queue, validate_params):
+        super().__init__(address, _Handler)
+        self.queue = queue
+        self.validate_params = validate_params
+
+
+class Daemon:
+    """Download daemon.
+
+    Runs up to num_jobs jobs of queue at the same time, calling run_job
+    (which raises on failure) for each of them, and serves the control
+    API on host:port. validate_params returns an error message for the
+    parameters of a submitted job, or None if they are valid.
+    """
+
+    def __init__(self, queue, run_job, validate_params, num_jobs=1,
+                 host='127.0.0.1', port=DEFAULT_PORT):
+        self._queue = queue
+        self._run_job = run_job
+        self._num_jobs = num_jobs
+        self._server = _Server((host, port), queue, validate_params)
+        self._workers = []
+        self._stopping = False
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def port(self):
+        return self._server.server_port
+
+    def _work(self):
+        while True:
+            job = self._queue.take()
+
+            if job is None:
+                return
+
+            self._logger.info('starting job {}'.format(job.id))
+
+            try:
+                self._run_job(job)
+            except Exception as e:
+                if self._stopping:
+                    # Resume it when the daemon restarts.
+                    self._queue.set_state(job, Job.QUEUED)
+                elif job.cancelled:
+                    self._queue.set_state(job, Job.CANCELLED)
+                else:
+                    self._logger.warning('job {} failed: {}'.format(job.id, e))
+                    self._queue.set_state(job, Job.FAILED, str(e))
+            else:
+                self._queue.set_state(job, Job.DONE)
+            finally:
+                job.set_downloader(None, None)
+
+            self._logger.info('job {} ended: {}'.format(job.id, job.state))
+
+    def start(self):
+        for i in range(self._num_jobs):
+            worker = threading.Thread(target=self._work)
+            worker.start()
+            self._workers.append(worker)
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def shutdown(self):
+        # The server may not be serving: do not wait for it.
+        self._server.server_close()
+        self._stopping = True
+        self._queue.close()
+
+        for job in self._queue.jobs():
+            if job.state == Job.RUNNING:
+                job.cancel()
+
+        for worker in self._workers:
+            worker.join()
+
+    def stop_serving(self):
+        """Makes serve_forever return (from another thread)."""
+        self._server.shutdown()
+
+
+class DaemonClient:
+    """Client of the control API of a daemon listening on host:port."""
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, timeout=10):
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+
+    def _request(self, method, path, obj=None):
+        conn = http.client.HTTPConnection(self._host, self._port,
+                                          timeout=self._timeout)
+        body = None
+        headers = {}
+
+        if obj is not None:
+            body = json.dumps(obj).encode()
+            headers['Content-Type'] = 'application/json'
+
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except ConnectionRefusedError:
+            tmpl = 'cannot connect to the daemon on {}:{} (is it running?)'
+            raise DaemonError(tmpl.format(self._host, self._port))
+        except OSError as e:
+            raise DaemonError('cannot communicate with the daemon: {}'.format(e))
+        finally:
+            conn.close()
+
+        try:
+            result = json.loads(data.decode())
+        except ValueError:
+            raise DaemonError('invalid response from the daemon')
+
+        if response.status >= 400:
+            raise DaemonError(result.get('error', 'HTTP status {}'.format(response.status)))
+
+        return result
+
+    def submit(self, params):
+        return self._request('POST', '/jobs', params)
+
+    def jobs(self):
+        return self._request('GET', '/jobs')['jobs']
+
+    def job(self, job_id):
+        return self._request('GET', '/jobs/{}'.format(job_id))
+
+    def cancel(self, job_id):
+        return self._request('DELETE', '/jobs/{}'.format(job_id))
@@ -37,6 +37,9 @@ class ProgressBar:
         self._filename = filename
         self._segments_count = segments_count
 
+    def set_segments_count(self, segments_count):
+        self._segments_count = segments_count
+
     @staticmethod
     def _get_terminal_width():
         if hasattr(shutil, 'get_terminal_size'):
@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from toutvcli import daemon
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'queue.json')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_persist(self):
+        queue = daemon.JobQueue(self._path)
+        job1 = queue.add({'show': 'infoman'})
+        job2 = queue.add({'show': 'district-31'})
+        self.assertIs(queue.take(), job1)
+        self.assertIsNone(queue.cancel(42))
+        self.assertIs(queue.cancel(job2.id), job2)
+        self.assertEqual(job2.state, daemon.Job.CANCELLED)
+
+        # The running job is queued again.
+        queue = daemon.JobQueue(self._path)
+        jobs = queue.jobs()
+        self.assertEqual([job.id for job in jobs], [1, 2])
+        self.assertEqual(jobs[0].state, daemon.Job.QUEUED)
+        self.assertEqual(jobs[0].params, {'show': 'infoman'})
+        self.assertEqual(jobs[1].state, daemon.Job.CANCELLED)
+        self.assertEqual(queue.add({'show': 'x'}).id, 3)
+
+    def test_close(self):
+        queue = daemon.JobQueue(self._path)
+        queue.close()
+        self.assertIsNone(queue.take())
+
+
+class _FakeDownloader:
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.num_segments = 10
+        self.done_segments = 4
+        self.done_bytes = 4096
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._queue = daemon.JobQueue(os.path.join(self._dir, 'queue.json'))
+        self._started = threading.Event()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _run_job(self, job):
+        if job.params['show'] == 'fail':
+            raise RuntimeError('no such show')
+
+        downloader = _FakeDownloader()
+        job.set_downloader('S01E01', downloader)
+        self._started.set()
+
+        if not downloader.cancelled.wait(10):
+            raise RuntimeError('not cancelled')
+
+        raise RuntimeError('cancelled')
+
+    @staticmethod
+    def _validate_params(params):
+        if 'show' not in params:
+            return 'missing show'
+
+        return None
+
+    def _wait_state(self, client, job_id, state):
+        for i in range(100):
+            job = client.job(job_id)
+
+            if job['state'] == state:
+                return job
+
+            self._started.wait(.05)
+
+        self.fail('job {} is {}'.format(job_id, job['state']))
+
+    def test_api(self):
+        dmn = daemon.Daemon(self._queue, self._run_job, self._validate_params,
+                            port=0)
+        dmn.start()
+        thread = threading.Thread(target=dmn.serve_forever)
+        thread.start()
+
+        try:
+            client = daemon.DaemonClient(port=dmn.port)
+
+            with self.assertRaises(daemon.DaemonError):
+                client.submit({})
+
+            with self.assertRaises(daemon.DaemonError):
+                client.job(42)
+
+            job1 = client.submit({'show': 'fail'})
+            self.assertEqual(job1['state'], daemon.Job.QUEUED)
+            job1 = self._wait_state(client, job1['id'], daemon.Job.FAILED)
+            self.assertEqual(job1['error'], 'no such show')
+
+            job2 = client.submit({'show': 'infoman'})
+            self.assertTrue(self._started.wait(10))
+            job2 = client.job(job2['id'])
+            self.assertEqual(job2['state'], daemon.Job.RUNNING)
+            self.assertEqual(job2['progress'], {
+                'episode': 'S01E01',
+                'done_segments': 4,
+                'num_segments': 10,
+                'done_bytes': 4096,
+            })
+
+            client.cancel(job2['id'])
+            self._wait_state(client, job2['id'], daemon.Job.CANCELLED)
+            self.assertEqual(len(client.jobs()), 2)
+        finally:
+            dmn.stop_serving()
+            thread.join()
+            dmn.shutdown()
+
+    def test_shutdown_requeues(self):
+        dmn = daemon.Daemon(self._queue, self._run_job, self._validate_params,
+                            port=0)
+        dmn.start()
+        job = self._queue.add({'show': 'infoman'})
+        self.assertTrue(self._started.wait(10))
+        dmn.shutdown()
+        self.assertEqual(job.state, daemon.Job.QUEUED)
+
+    def test_no_daemon(self):
+        dmn = daemon.Daemon(self._queue, self._run_job, self._validate_params,
+                            port=0)
+        port = dmn.port
+        dmn.shutdown()
+
+        with self.assertRaises(daemon.DaemonError):
+            daemon.DaemonClient(port=port).jobs()
@@ -8,6 +8,7 @@ from toutvqt.settings import QTouTvSettings
 from toutvqt.settings import SettingsKeys
 from toutvqt import config
 import toutv.client
+import toutv.metrics
 
 
 class _QTouTvApp(Qt.QApplication):
@@ -15,11 +16,14 @@ class _QTouTvApp(Qt.QApplication):
         super().__init__(args)
 
         self._proxies = None
+        self._metrics_writer = None
+        self.main_window = None
 
         self.setOrganizationName(config.ORG_NAME)
         self.setApplicationName(config.APP_NAME)
 
         self._setup_client()
+        self._setup_metrics()
         self._setup_settings()
         self._setup_ui()
         self._start()
@@ -27,6 +31,13 @@ class _QTouTvApp(Qt.QApplication):
     def get_settings(self):
         return self._settings
 
+    def get_metrics_writer(self):
+        return self._metrics_writer
+
+    def close_metrics_writer(self):
+        if self._metrics_writer is not None:
+            self._metrics_writer.close()
+
     def get_proxies(self):
         return self._proxies
 
@@ -47,6 +58,20 @@ class _QTouTvApp(Qt.QApplication):
     def _setup_client(self):
         self._client = toutv.client.Client()
 
+    def _setup_metrics(self):
+        # Per-segment download metrics are only recorded on demand.
+        path = os.environ.get('QTOUTV_METRICS_FILE')
+
+        if not path:
+            return
+
+        fmt = os.environ.get('QTOUTV_METRICS_FORMAT', 'jsonl')
+
+        try:
+            self._metrics_writer = toutv.metrics.open_writer(path, fmt)
+        except (OSError, ValueError) as e:
+            logging.error('Cannot record metrics to "{}": {}'.format(path, e))
+
     def _setup_settings(self):
         # Create a default settings
         self._settings = QTouTvSettings()
@@ -83,12 +108,19 @@ class _QTouTvApp(Qt.QApplication):
                 logging.warning('Cannot create directory "{}"'.format(value))
                 pass
 
+    def _on_setting_dl_rate_limit_changed(self, value):
+        # The main window uses the initial value when it is created.
+        if self.main_window is not None:
+            self.main_window.set_download_rate_limit(int(value) * 1024)
+
     def _setting_item_changed(self, key, value):
         logging.debug('Setting "{}" changed to "{}"'.format(key, value))
         if key == SettingsKeys.NETWORK_HTTP_PROXY:
             self._on_setting_http_proxy_changed(value)
         elif key == SettingsKeys.FILES_DOWNLOAD_DIR:
             self._on_setting_dl_dir_changed(value)
+        elif key == SettingsKeys.DL_RATE_LIMIT:
+            self._on_setting_dl_rate_limit_changed(value)
 
 
 def _register_sigint(app):
@@ -110,8 +142,10 @@ def run():
     _configure_logging()
     app = _QTouTvApp(sys.argv)
     _register_sigint(app)
+    ret = app.exec_()
+    app.close_metrics_writer()
 
-    return app.exec_()
+    return ret
 
 if __name__ == '__main__':
     run()
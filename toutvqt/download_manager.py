@@ -1,8 +1,10 @@
 import queue
 import logging
+import functools
 from PyQt4 import Qt
 from PyQt4 import QtCore
 from toutv import dl
+from toutv import ratelimit
 
 
 class _DownloadWork:
@@ -68,9 +70,12 @@ class _QDownloadWorker(Qt.QObject):
     download_cancelled = QtCore.pyqtSignal(object)
     download_error = QtCore.pyqtSignal(object, object)
 
-    def __init__(self, download_event_type, i):
+    def __init__(self, download_event_type, i, rate_limiter,
+                 metrics_writer):
         super().__init__()
         self._download_event_type = download_event_type
+        self._rate_limiter = rate_limiter
+        self._metrics_writer = metrics_writer
         self._current_work = None
         self._downloader = None
         self._cancelled = False
@@ -101,11 +106,25 @@ class _QDownloadWorker(Qt.QObject):
         output_dir = work.get_output_dir()
         proxies = work.get_proxies()
 
-        downloader = dl.Downloader(episode, bitrate=bitrate,
-                                   output_dir=output_dir,
-                                   on_dl_start=self._on_dl_start,
+        seg_handler = dl.FilesystemSegmentHandler(episode=episode,
+                                                  bitrate=bitrate,
+                                                  output_dir=output_dir,
+                                                  overwrite=True)
+        seg_provider = dl.ToutvApiSegmentProvider(
+            episode=episode, bitrate=bitrate, proxies=proxies,
+            rate_limiter=self._rate_limiter)
+        on_dl_start = functools.partial(self._on_dl_start,
+                                        seg_handler.filename)
+        on_segment_metrics = None
+
+        if self._metrics_writer is not None:
+            on_segment_metrics = functools.partial(self._metrics_writer.record,
+                                                   download=seg_handler.filename)
+
+        downloader = dl.Downloader(seg_provider, seg_handler,
+                                   on_dl_start=on_dl_start,
                                    on_progress_update=self._on_progress_update,
-                                   overwrite=True, proxies=proxies)
+                                   on_segment_metrics=on_segment_metrics)
         self._downloader = downloader
 
         tmpl = 'Starting download of "{}" @ {} bps'
@@ -156,12 +175,22 @@ class QDownloadManager(Qt.QObject):
     download_error = QtCore.pyqtSignal(object, object)
     download_cancelled = QtCore.pyqtSignal(object)
 
-    def __init__(self, nb_threads=5):
+    def __init__(self, nb_threads=5, rate_limit=None, metrics_writer=None):
         super().__init__()
 
+        # Shared by all the workers: the limit applies to the total rate.
+        self._rate_limiter = ratelimit.RateLimiter(rate_limit)
+
+        # Records the metrics of each downloaded segment, if not None.
+        self._metrics_writer = metrics_writer
         self._download_event_type = Qt.QEvent.registerEventType()
         self._setup_threads(nb_threads)
 
+    def set_rate_limit(self, rate_limit):
+        """Sets the total download rate limit (bytes/second, None or 0
+        for no limit). Running downloads are affected immediately."""
+        self._rate_limiter.set_rate(rate_limit)
+
     def exit(self):
         # Cancel all workers
         logging.debug('Cancelling all download workers')
@@ -196,7 +225,9 @@ class QDownloadManager(Qt.QObject):
 
         for i in range(nb_threads):
             thread = Qt.QThread()
-            worker = _QDownloadWorker(self._download_event_type, i)
+            worker = _QDownloadWorker(self._download_event_type, i,
+                                      self._rate_limiter,
+                                      self._metrics_writer)
             self._threads.append(thread)
             self._workers.append(worker)
             self._available_workers.put(worker)
@@ -43,7 +43,11 @@ class QTouTvMainWindow(Qt.QMainWindow, utils.QtUiLoad):
     def _add_tableview(self):
         settings = self._app.get_settings()
         nb_threads = settings.get_download_slots()
-        self._download_manager = QDownloadManager(nb_threads=nb_threads)
+        rate_limit = settings.get_download_rate_limit() * 1024
+        metrics_writer = self._app.get_metrics_writer()
+        self._download_manager = QDownloadManager(nb_threads=nb_threads,
+                                                  rate_limit=rate_limit,
+                                                  metrics_writer=metrics_writer)
 
         model = QDownloadsTableModel(self._download_manager)
         model.download_finished.connect(self._on_download_finished)
@@ -154,6 +158,9 @@ class QTouTvMainWindow(Qt.QMainWindow, utils.QtUiLoad):
             eid = work.get_episode().get_id()
             self._downloads_tableview_model.remove_episode_id_item(eid)
 
+    def set_download_rate_limit(self, rate_limit):
+        self._download_manager.set_rate_limit(rate_limit)
+
     def _on_treeview_fetch_start(self):
         self.refresh_emissions_action.setEnabled(False)
 
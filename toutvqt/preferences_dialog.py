@@ -20,12 +20,14 @@ class QTouTvPreferencesDialog(utils.QCommonDialog, utils.QtUiLoad):
         dl_dir = settings.get_download_directory()
         proxy_url = settings.get_http_proxy()
         download_slots = settings.get_download_slots()
+        rate_limit = settings.get_download_rate_limit()
         always_max_quality = settings.get_always_max_quality()
         remove_finished = settings.get_remove_finished()
 
         self.http_proxy_value.setText(proxy_url)
         self.download_directory_value.setText(dl_dir)
         self.download_slots_value.setValue(download_slots)
+        self.rate_limit_value.setValue(rate_limit)
         self.always_max_quality_check.setChecked(always_max_quality)
         self.remove_finished_check.setChecked(remove_finished)
 
@@ -55,12 +57,14 @@ class QTouTvPreferencesDialog(utils.QCommonDialog, utils.QtUiLoad):
         dl_dir_value = self.download_directory_value.text().strip()
         proxy_url = self.http_proxy_value.text().strip()
         download_slots = self.download_slots_value.value()
+        rate_limit = self.rate_limit_value.value()
         always_max_quality = self.always_max_quality_check.isChecked()
         remove_finished = self.remove_finished_check.isChecked()
 
         settings[SettingsKeys.NETWORK_HTTP_PROXY] = proxy_url
         settings[SettingsKeys.FILES_DOWNLOAD_DIR] = dl_dir_value
         settings[SettingsKeys.DL_DOWNLOAD_SLOTS] = download_slots
+        settings[SettingsKeys.DL_RATE_LIMIT] = rate_limit
         settings[SettingsKeys.DL_ALWAYS_MAX_QUALITY] = always_max_quality
         settings[SettingsKeys.DL_REMOVE_FINISHED] = remove_finished
 
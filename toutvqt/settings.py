@@ -9,6 +9,7 @@ class SettingsKeys:
     FILES_DOWNLOAD_DIR = 'files/download_directory'
     NETWORK_HTTP_PROXY = 'network/http_proxy'
     DL_DOWNLOAD_SLOTS = 'downloads/download_slots'
+    DL_RATE_LIMIT = 'downloads/rate_limit'
     DL_ALWAYS_MAX_QUALITY = 'downloads/always_max_quality'
     DL_REMOVE_FINISHED = 'downloads/remove_finished'
 
@@ -19,6 +20,7 @@ class QTouTvSettings(Qt.QObject):
         SettingsKeys.FILES_DOWNLOAD_DIR: str,
         SettingsKeys.NETWORK_HTTP_PROXY: str,
         SettingsKeys.DL_DOWNLOAD_SLOTS: int,
+        SettingsKeys.DL_RATE_LIMIT: int,
         SettingsKeys.DL_ALWAYS_MAX_QUALITY: bool,
         SettingsKeys.DL_REMOVE_FINISHED: bool,
     }
@@ -36,6 +38,7 @@ class QTouTvSettings(Qt.QObject):
         self.defaults[SettingsKeys.FILES_DOWNLOAD_DIR] = def_dl_dir
         self.defaults[SettingsKeys.NETWORK_HTTP_PROXY] = ""
         self.defaults[SettingsKeys.DL_DOWNLOAD_SLOTS] = 5
+        self.defaults[SettingsKeys.DL_RATE_LIMIT] = 0
         self.defaults[SettingsKeys.DL_ALWAYS_MAX_QUALITY] = False
         self.defaults[SettingsKeys.DL_REMOVE_FINISHED] = False
 
@@ -102,6 +105,10 @@ class QTouTvSettings(Qt.QObject):
     def get_download_slots(self):
         return int(self._settings_dict[SettingsKeys.DL_DOWNLOAD_SLOTS])
 
+    def get_download_rate_limit(self):
+        """Returns the download rate limit in kiB/s (0 means no limit)."""
+        return int(self._settings_dict[SettingsKeys.DL_RATE_LIMIT])
+
     def get_always_max_quality(self):
         return self._settings_dict[SettingsKeys.DL_ALWAYS_MAX_QUALITY]
 